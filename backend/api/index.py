@@ -1,5 +1,10 @@
 """
 Vercel serverless function entry point
+
+Vercel only needs the WSGI callable below. For a long-running server use
+gunicorn instead of the Flask dev server:
+
+    gunicorn src.app:app    # reads gunicorn.conf.py
 """
 import os
 import sys
@@ -11,4 +16,4 @@ sys.path.insert(0, str(Path(__file__).parent.parent))
 from src.app import app
 
 # Vercel expects a callable named 'app'
-# The Flask app instance is already callable
\ No newline at end of file
+# The Flask app instance is already callable
@@ -0,0 +1,28 @@
+"""
+Gunicorn configuration for running the Flask app outside of Vercel.
+
+Gunicorn picks this file up automatically when started from the backend
+directory, e.g. ``gunicorn src.app:app``.
+"""
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+
+# Threaded workers keep HTTP connections alive between requests. Requests
+# mostly wait on Supabase Storage and Postgres sockets (which release the
+# GIL), so concurrency comes from threads and one worker per core (+1) is
+# enough.
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', 8))
+
+# Each worker holds at most threads + 1 database connections (see
+# _engine_options in src/config.py), so the server opens up to
+# workers x (threads + 1): 5 x 9 = 45 on 4 cores, under PostgreSQL's default
+# max_connections of 100. Keep that product below the database's limit when
+# raising either setting.
+workers = int(os.getenv('WEB_CONCURRENCY', (os.cpu_count() or 1) + 1))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 120))
+accesslog = '-'
+errorlog = '-'
@@ -96,7 +96,19 @@ def run_migrations_online():
 
     connectable = get_engine()
 
+    # Objects marked info={'dialect': ...} (e.g. the PostgreSQL-only GIN
+    # index) only exist on that dialect; don't report them missing elsewhere
+    def include_object(object, name, type_, reflected, compare_to):
+        dialect = object.info.get('dialect') if hasattr(object, 'info') else None
+        return dialect is None or dialect == connectable.dialect.name
+
+    conf_args.setdefault("include_object", include_object)
+
     with connectable.connect() as connection:
+        # Commit each revision on its own so migrations can use
+        # op.get_context().autocommit_block() for CREATE INDEX CONCURRENTLY
+        conf_args.setdefault("transaction_per_migration", True)
+
         context.configure(
             connection=connection,
             target_metadata=get_metadata(),
@@ -0,0 +1,61 @@
+"""Server-side timestamps
+
+Revision ID: 3b8d0c6e2a41
+Revises: f955cba56880
+Create Date: 2026-10-14 09:12:40.518204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b8d0c6e2a41'
+down_revision = 'f955cba56880'
+branch_labels = None
+depends_on = None
+
+UTC_NOW = "TIMEZONE('utc', CURRENT_TIMESTAMP)"
+
+TIMESTAMP_COLUMNS = [
+    ('users', 'created_at'),
+    ('users', 'updated_at'),
+    ('files', 'uploaded_at'),
+    ('files', 'updated_at'),
+]
+
+TRIGGER_TABLES = ['users', 'files']
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    for table, column in TIMESTAMP_COLUMNS:
+        op.alter_column(table, column, server_default=sa.text(UTC_NOW))
+
+    op.execute(f"""
+        CREATE OR REPLACE FUNCTION set_updated_at() RETURNS TRIGGER AS $$
+        BEGIN
+            NEW.updated_at = {UTC_NOW};
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    for table in TRIGGER_TABLES:
+        op.execute(
+            f"CREATE TRIGGER {table}_set_updated_at BEFORE UPDATE ON {table} "
+            "FOR EACH ROW EXECUTE FUNCTION set_updated_at()"
+        )
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    for table in TRIGGER_TABLES:
+        op.execute(f"DROP TRIGGER IF EXISTS {table}_set_updated_at ON {table}")
+    op.execute("DROP FUNCTION IF EXISTS set_updated_at()")
+
+    for table, column in TIMESTAMP_COLUMNS:
+        op.alter_column(table, column, server_default=None)
@@ -0,0 +1,40 @@
+"""Store tags as text[]
+
+Revision ID: 9e2d5b7a1f08
+Revises: c71f4a9e0d52
+Create Date: 2026-10-14 10:41:55.730112
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9e2d5b7a1f08'
+down_revision = 'c71f4a9e0d52'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    op.execute(
+        "ALTER TABLE files ALTER COLUMN tags TYPE text[] "
+        "USING string_to_array(NULLIF(tags, ''), ',')"
+    )
+    with op.get_context().autocommit_block():
+        op.execute("CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_files_tags_gin ON files USING GIN (tags)")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_files_tags_gin")
+    op.execute(
+        "ALTER TABLE files ALTER COLUMN tags TYPE varchar(500) "
+        "USING array_to_string(tags, ',')"
+    )
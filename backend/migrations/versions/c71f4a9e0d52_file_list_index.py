@@ -0,0 +1,47 @@
+"""File list index
+
+Revision ID: c71f4a9e0d52
+Revises: 3b8d0c6e2a41
+Create Date: 2026-10-14 10:03:17.264981
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c71f4a9e0d52'
+down_revision = '3b8d0c6e2a41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        # Build without locking writes to files; CONCURRENTLY can't run in a transaction
+        with op.get_context().autocommit_block():
+            op.execute(
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_files_user_active_uploaded "
+                "ON files (user_id, uploaded_at DESC, id DESC) WHERE is_deleted = false"
+            )
+            op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_files_is_deleted")
+    else:
+        with op.batch_alter_table('files', schema=None) as batch_op:
+            batch_op.create_index(
+                'ix_files_user_active_uploaded',
+                ['user_id', sa.text('uploaded_at DESC'), sa.text('id DESC')],
+                unique=False,
+                sqlite_where=sa.text('is_deleted = 0'),
+            )
+            batch_op.drop_index(batch_op.f('ix_files_is_deleted'))
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            op.execute("CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_files_is_deleted ON files (is_deleted)")
+            op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_files_user_active_uploaded")
+    else:
+        with op.batch_alter_table('files', schema=None) as batch_op:
+            batch_op.create_index(batch_op.f('ix_files_is_deleted'), ['is_deleted'], unique=False)
+            batch_op.drop_index('ix_files_user_active_uploaded')
@@ -3,24 +3,39 @@ Main Flask application
 """
 import os
 import logging
-import sys
-from flask import Flask, jsonify, make_response, request
+import logging.config
+import threading
+import time
+from flask import Flask, jsonify
 from flask_cors import CORS
-from flask_migrate import Migrate
-from dotenv import load_dotenv
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+# Load environment variables before importing src modules, which read
+# settings at import time (skipped when there is no .env file, e.g. on Vercel)
+_ENV_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), '.env')
+if os.path.exists(_ENV_FILE):
+    from dotenv import load_dotenv
+    load_dotenv(_ENV_FILE)
 
 from src.config import get_config
+from src.json_provider import init_json_provider
 from src.models import db
 from src.routes import auth_bp, files_bp
-
-# Load environment variables
-load_dotenv()
+from src.uploads import UploadRequest
 
 # Set Python unbuffered output
 os.environ['PYTHONUNBUFFERED'] = '1'
 
+
+def _attach_migrate(app, db):
+    """Register Flask-Migrate (only needed for the `flask db` commands)."""
+    from flask_migrate import Migrate
+    return Migrate(app, db)
+
+
 # Create Flask app
 app = Flask(__name__)
+app.request_class = UploadRequest
 
 # Load configuration
 config = get_config()
@@ -31,49 +46,57 @@ log_level = os.getenv('LOG_LEVEL', 'INFO').upper()
 if log_level not in ['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL']:
     log_level = 'INFO'
 
-# Configure logging using Flask's built-in logger
-if not app.debug:
-    # In production, log to stdout for Vercel
-    app.logger.handlers.clear()
-    handler = logging.StreamHandler(sys.stdout)
-    handler.setFormatter(logging.Formatter(
-        '[%(asctime)s] %(levelname)s in %(module)s: %(message)s'
-    ))
-    app.logger.addHandler(handler)
-    app.logger.setLevel(getattr(logging, log_level))
-    
-    # Also configure root logger for libraries
-    logging.basicConfig(
-        level=getattr(logging, log_level),
-        format='[%(asctime)s] %(levelname)s in %(module)s: %(message)s',
-        stream=sys.stdout
-    )
-else:
-    # In development, Flask's default logging is fine
-    app.logger.setLevel(getattr(logging, log_level))
+# Configure logging once: everything writes to stdout (for Vercel). The app's
+# own loggers (src.*, which includes Flask's "src.app") use LOG_LEVEL; third
+# party ones (alembic, httpx, ...) stay at WARNING
+logging.config.dictConfig({
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'std': {'format': '[%(asctime)s] %(levelname)s in %(module)s: %(message)s'},
+    },
+    'handlers': {
+        'stdout': {
+            'class': 'logging.StreamHandler',
+            'stream': 'ext://sys.stdout',
+            'formatter': 'std',
+        },
+    },
+    'root': {'level': 'WARNING', 'handlers': ['stdout']},
+    'loggers': {'src': {'level': log_level}},
+})
 
 # Log startup information
-app.logger.info(f"Starting Flask app with log level: {log_level}")
-app.logger.info(f"Environment: {os.getenv('FLASK_ENV', 'development')}")
-app.logger.info(f"Storage mode: {os.getenv('STORAGE_MODE', 'local')}")
-app.logger.info(f"MAX_CONTENT_LENGTH: {app.config.get('MAX_CONTENT_LENGTH')} bytes")
-app.logger.info(f"MAX_FILE_SIZE env: {os.getenv('MAX_FILE_SIZE', 'not set')}")
+if log_level == 'DEBUG':
+    app.logger.debug(f"Starting Flask app with log level: {log_level}")
+    app.logger.debug(f"Environment: {os.getenv('FLASK_ENV', 'development')}")
+    app.logger.debug(f"Storage mode: {app.config['STORAGE_MODE']}")
+    app.logger.debug(f"MAX_CONTENT_LENGTH: {app.config.get('MAX_CONTENT_LENGTH')} bytes")
+    app.logger.debug(f"MAX_FILE_SIZE env: {os.getenv('MAX_FILE_SIZE', 'not set')}")
 
 # Ensure MAX_CONTENT_LENGTH is set for Flask to enforce file size limits
 if app.config.get('MAX_CONTENT_LENGTH') is None:
     app.logger.warning("MAX_CONTENT_LENGTH not set, setting to default 100MB")
     app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024
 
+# Take the client address from X-Forwarded-For when behind trusted proxies;
+# otherwise every client would share the proxy's address and login limit
+if app.config.get('PROXY_FIX_X_FOR'):
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_FIX_X_FOR'])
+
 # Initialize extensions
+init_json_provider(app)
 db.init_app(app)
-migrate = Migrate(app, db)
+if app.debug or os.getenv('ENABLE_MIGRATE'):
+    migrate = _attach_migrate(app, db)
 
-# Configure CORS with more comprehensive settings for production
+# Configure CORS with more comprehensive settings for production.
+# Flask-CORS also answers OPTIONS preflight requests itself.
 cors_config = {
     'origins': app.config['CORS_ORIGINS'],
     'supports_credentials': True,
     'allow_headers': ['Content-Type', 'Authorization'],
-    'methods': ['GET', 'POST', 'PUT', 'DELETE', 'OPTIONS'],
+    'methods': ['GET', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'],
     'expose_headers': ['Content-Range', 'X-Content-Range']
 }
 CORS(app, **cors_config)
@@ -83,18 +106,6 @@ app.register_blueprint(auth_bp)
 app.register_blueprint(files_bp)
 
 
-# Handle preflight requests
-@app.before_request
-def handle_preflight():
-    if request.method == "OPTIONS":
-        response = make_response()
-        response.headers.add("Access-Control-Allow-Origin", "*")
-        response.headers.add("Access-Control-Allow-Headers", "Content-Type,Authorization")
-        response.headers.add("Access-Control-Allow-Methods", "GET,PUT,POST,DELETE,OPTIONS")
-        response.headers.add("Access-Control-Allow-Credentials", "true")
-        return response
-
-
 @app.route("/")
 def index():
     """Root endpoint"""
@@ -105,15 +116,37 @@ def index():
     })
 
 
+# Cached result of the health check's database probe
+_HEALTH_TTL = 5.0
+_HEALTH = {'ts': 0.0, 'database': 'unknown'}
+_health_lock = threading.Lock()
+
+
+def _probe_database():
+    """Run `SELECT 1` at most once per _HEALTH_TTL seconds and return the status."""
+    if time.monotonic() - _HEALTH['ts'] < _HEALTH_TTL:
+        return _HEALTH['database']
+    
+    # Only one thread probes; the others serve the last known status
+    if not _health_lock.acquire(blocking=False):
+        return _HEALTH['database']
+    try:
+        try:
+            db.session.execute(db.text('SELECT 1'))
+            _HEALTH['database'] = "connected"
+        except Exception as e:
+            _HEALTH['database'] = f"error: {str(e)}"
+        _HEALTH['ts'] = time.monotonic()
+    finally:
+        _health_lock.release()
+    
+    return _HEALTH['database']
+
+
 @app.route("/api/health")
 def health():
     """Health check endpoint"""
-    # Check database connection
-    try:
-        db.session.execute(db.text('SELECT 1'))
-        db_status = "connected"
-    except Exception as e:
-        db_status = f"error: {str(e)}"
+    db_status = _probe_database()
     
     return jsonify({
         "status": "healthy",
@@ -139,5 +172,9 @@ def init_db():
 
 
 if __name__ == "__main__":
-    port = int(os.getenv("PORT", 5000))
-    app.run(host="0.0.0.0", port=port, debug=app.config["DEBUG"])
\ No newline at end of file
+    if app.config["DEBUG"]:
+        port = int(os.getenv("PORT", 5000))
+        app.run(host="0.0.0.0", port=port, debug=True)
+    else:
+        # Production: hand over to gunicorn (settings in gunicorn.conf.py)
+        os.execvp("gunicorn", ["gunicorn", "src.app:app"])
\ No newline at end of file
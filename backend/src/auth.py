@@ -2,15 +2,46 @@
 Authentication utilities for JWT token management
 """
 import os
+import re
+import threading
+import time
+from collections import OrderedDict, deque
 from datetime import datetime, timedelta
-from functools import wraps
+from functools import lru_cache, wraps
 from typing import Optional, Dict, Any
 
-import jwt
-from flask import request, jsonify
-from werkzeug.security import check_password_hash
+from flask import current_app, g, request, jsonify
+from sqlalchemy import Row, select
+from sqlalchemy.orm import load_only, make_transient_to_detached
+from werkzeug.security import check_password_hash, generate_password_hash
 
-from src.models import db, User
+from src.models import db, User, PASSWORD_HASH_METHOD
+
+# Read once at import; the secret does not change for the life of the process.
+# Kept as bytes so PyJWT's HMAC key preparation has nothing to encode per call.
+_KEY = os.getenv('SECRET_KEY', 'dev-secret-key').encode()
+_ALG = 'HS256'
+_ALGORITHMS = [_ALG]
+_utcnow = datetime.utcnow
+
+# "Bearer <header>.<payload>.<signature>" with base64url segments
+_BEARER_RE = re.compile(r'^Bearer ([A-Za-z0-9_\-]+\.[A-Za-z0-9_\-]+\.[A-Za-z0-9_\-]+)$')
+
+# Columns route handlers read from the current user; skips password_hash etc.
+_CURRENT_USER_COLUMNS = (User.id, User.username, User.email, User.is_active, User.created_at)
+_CURRENT_USER_OPTIONS = [load_only(*_CURRENT_USER_COLUMNS)]
+
+# Recently authenticated users: user_id -> (column values, expiry on the
+# monotonic clock), least recently used first; see _cached_user()
+_USER_CACHE_SIZE = 10000
+_user_cache: "OrderedDict[int, tuple]" = OrderedDict()
+_user_cache_lock = threading.Lock()
+
+# Recent login attempt times per client, for login_rate_limited()
+_LOGIN_WINDOW = 60.0
+_MAX_TRACKED_CLIENTS = 10000
+_login_attempts: Dict[str, deque] = {}
+_login_attempts_lock = threading.Lock()
 
 
 def generate_token(user_id: int, expires_in: int = 86400) -> str:
@@ -24,14 +55,16 @@ def generate_token(user_id: int, expires_in: int = 86400) -> str:
     Returns:
         JWT token string
     """
+    import jwt
+
+    now = _utcnow()
     payload = {
         'user_id': user_id,
-        'exp': datetime.utcnow() + timedelta(seconds=expires_in),
-        'iat': datetime.utcnow()
+        'exp': now + timedelta(seconds=expires_in),
+        'iat': now
     }
     
-    secret_key = os.getenv('SECRET_KEY', 'dev-secret-key')
-    return jwt.encode(payload, secret_key, algorithm='HS256')
+    return jwt.encode(payload, _KEY, algorithm=_ALG)
 
 
 def decode_token(token: str) -> Optional[Dict[str, Any]]:
@@ -44,9 +77,10 @@ def decode_token(token: str) -> Optional[Dict[str, Any]]:
     Returns:
         Decoded payload or None if invalid
     """
+    import jwt
+
     try:
-        secret_key = os.getenv('SECRET_KEY', 'dev-secret-key')
-        payload = jwt.decode(token, secret_key, algorithms=['HS256'])
+        payload = jwt.decode(token, _KEY, algorithms=_ALGORITHMS)
         return payload
     except jwt.ExpiredSignatureError:
         return None
@@ -58,24 +92,84 @@ def get_current_user() -> Optional[User]:
     """
     Get current user from request token
     
+    The result is cached on `flask.g` for the rest of the request.
+    
     Returns:
         User object or None if not authenticated
     """
+    if '_current_user' not in g:
+        g._current_user = _load_current_user()
+    return g._current_user
+
+
+def _load_current_user() -> Optional[User]:
+    """Resolve the user for the request's Authorization header."""
     auth_header = request.headers.get('Authorization')
     
-    if not auth_header or not auth_header.startswith('Bearer '):
+    # Reject missing or malformed headers before any JWT or DB work
+    match = _BEARER_RE.match(auth_header) if auth_header else None
+    if not match:
         return None
     
-    token = auth_header.split(' ')[1]
-    payload = decode_token(token)
+    payload = decode_token(match.group(1))
     
     if not payload:
         return None
     
-    user = db.session.get(User, payload['user_id'])
+    user = _cached_user(payload['user_id'])
+    if user is not None:
+        return user
+    
+    user = db.session.get(User, payload['user_id'], options=_CURRENT_USER_OPTIONS)
+    
+    if not user or not user.is_active:
+        return None
+    
+    _cache_user(user)
     return user
 
 
+def _cached_user(user_id: int) -> Optional[User]:
+    """
+    User loaded by a request in the last USER_CACHE_TTL seconds, attached to
+    the current session without a SELECT (other columns load on access)
+    
+    Profile changes made through this process are seen at once (see
+    forget_cached_user); ones made elsewhere, e.g. deactivating the user,
+    within USER_CACHE_TTL.
+    """
+    now = time.monotonic()
+    with _user_cache_lock:
+        cached = _user_cache.get(user_id)
+        if not cached or cached[1] <= now:
+            return None
+        _user_cache.move_to_end(user_id)
+    
+    user = User(**dict(zip((column.key for column in _CURRENT_USER_COLUMNS), cached[0])))
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
+
+
+def _cache_user(user: User) -> None:
+    """Remember an active user's columns for _cached_user()."""
+    ttl = current_app.config.get('USER_CACHE_TTL')
+    if not ttl:
+        return
+    
+    values = tuple(getattr(user, column.key) for column in _CURRENT_USER_COLUMNS)
+    with _user_cache_lock:
+        _user_cache[user.id] = (values, time.monotonic() + ttl)
+        _user_cache.move_to_end(user.id)
+        while len(_user_cache) > _USER_CACHE_SIZE:
+            _user_cache.popitem(last=False)
+
+
+def forget_cached_user(user_id: int) -> None:
+    """Drop a user from the authenticated user cache, e.g. after a profile change."""
+    with _user_cache_lock:
+        _user_cache.pop(user_id, None)
+
+
 def login_required(f):
     """
     Decorator to require authentication for routes
@@ -95,20 +189,67 @@ def login_required(f):
     return decorated_function
 
 
-def authenticate_user(email: str, password: str) -> Optional[User]:
+@lru_cache(maxsize=1)
+def _dummy_password_hash() -> str:
+    """Hash checked for unknown emails, made with the same method as real ones."""
+    return generate_password_hash(os.urandom(16).hex(), method=PASSWORD_HASH_METHOD)
+
+
+def authenticate_user(email: str, password: str) -> Optional[Row]:
     """
     Authenticate user with email and password
     
+    An unknown email is still checked against a dummy hash, so it takes as long
+    as a wrong password and can't be told apart by response time.
+    
     Args:
         email: User email
         password: User password
     
     Returns:
-        User object if authenticated, None otherwise
+        Row with the user's id, email and username if authenticated, None otherwise
     """
-    user = User.query.filter_by(email=email).first()
+    user = db.session.execute(
+        select(User.id, User.email, User.username, User.password_hash)
+        .where(User.email == email)
+        .limit(1)
+    ).first()
     
-    if not user or not user.check_password(password):
+    # check_password_hash compares digests in constant time
+    password_hash = user.password_hash if user else _dummy_password_hash()
+    if not check_password_hash(password_hash, password) or not user:
         return None
     
-    return user
\ No newline at end of file
+    return user
+
+
+def login_rate_limited(client: str, limit: int) -> bool:
+    """
+    Record a login attempt and check it against the per-minute limit
+    
+    Runs before the password hash is checked, so bots hammering the login
+    endpoint are turned away before paying for the KDF. Counts are kept
+    per process.
+    
+    Args:
+        client: Client identifier (e.g. remote address)
+        limit: Allowed attempts per minute
+    
+    Returns:
+        True if the client is over the limit, False otherwise
+    """
+    now = time.monotonic()
+    with _login_attempts_lock:
+        if len(_login_attempts) > _MAX_TRACKED_CLIENTS:
+            for key in [k for k, v in _login_attempts.items() if now - v[-1] > _LOGIN_WINDOW]:
+                del _login_attempts[key]
+        
+        attempts = _login_attempts.setdefault(client, deque())
+        while attempts and now - attempts[0] > _LOGIN_WINDOW:
+            attempts.popleft()
+        
+        if len(attempts) >= limit:
+            return True
+        
+        attempts.append(now)
+        return False
@@ -0,0 +1,62 @@
+"""
+JSON providers for Flask: orjson-backed when available
+"""
+from datetime import date, datetime, timedelta
+
+from flask.json.provider import DefaultJSONProvider
+
+# Try to import orjson, but don't fail if it's not available
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+
+class IsoJSONProvider(DefaultJSONProvider):
+    """
+    Flask's default provider, but datetimes are encoded as ISO 8601 like
+    orjson does (naive values are UTC and get a "Z" suffix) instead of as
+    HTTP dates, so responses look the same with or without orjson.
+    """
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, datetime):
+            if o.utcoffset() in (None, timedelta(0)):
+                return o.replace(tzinfo=None).isoformat() + 'Z'
+            return o.isoformat()
+        if isinstance(o, date):
+            return o.isoformat()
+        return DefaultJSONProvider.default(o)
+
+
+class OrjsonProvider(IsoJSONProvider):
+    """
+    Drop-in replacement for Flask's default provider that encodes with orjson.
+
+    Datetimes are serialized natively in C; types orjson can't handle go
+    through the `default` hook.
+    """
+
+    _OPTIONS = orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z if ORJSON_AVAILABLE else 0
+
+    def dumps(self, obj, **kwargs):
+        option = self._OPTIONS
+        if kwargs.get('sort_keys', self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        if kwargs.get('indent'):
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self.default, option=option).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
+def init_json_provider(app):
+    """Use the orjson provider on the app when orjson is installed."""
+    if ORJSON_AVAILABLE:
+        app.json = OrjsonProvider(app)
+    else:
+        app.logger.info("orjson not available, using the default JSON provider")
+        app.json = IsoJSONProvider(app)
@@ -1,13 +1,51 @@
 """
 Database models for the file management service.
 """
-from datetime import datetime
+import os
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import DateTime, String, TypeDecorator
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
 
 db = SQLAlchemy()
 
 
+class utcnow(FunctionElement):
+    """Current UTC time evaluated by the database, for naive UTC timestamp columns."""
+    type = DateTime()
+    inherit_cache = True
+
+
+@compiles(utcnow, 'postgresql')
+def _pg_utcnow(element, compiler, **kw):
+    return "TIMEZONE('utc', CURRENT_TIMESTAMP)"
+
+
+@compiles(utcnow)
+def _default_utcnow(element, compiler, **kw):
+    return "CURRENT_TIMESTAMP"
+
+
+class CommaSeparatedList(TypeDecorator):
+    """List of strings stored as one comma-separated VARCHAR (the pre-text[] tags format)."""
+    impl = String(500)
+    cache_ok = True
+    
+    def process_bind_param(self, value, dialect):
+        return ','.join(value) if value else None
+    
+    def process_result_value(self, value, dialect):
+        return value.split(',') if value else []
+
+
+# Hash method for new passwords (werkzeug format, e.g. "scrypt:32768:8:1");
+# `python manage.py hash-bench` times the candidates on the current machine.
+# Existing hashes keep verifying, since each one records its own method.
+PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'scrypt')
+
+
 class User(db.Model):
     """User model for authentication and file ownership."""
     
@@ -17,16 +55,19 @@ class User(db.Model):
     username = db.Column(db.String(80), unique=True, nullable=False, index=True)
     email = db.Column(db.String(120), unique=True, nullable=False, index=True)
     password_hash = db.Column(db.String(255), nullable=False)
-    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = db.Column(db.DateTime, nullable=False, server_default=utcnow())
+    # The database's clock is written on every UPDATE the app issues, on any
+    # dialect or schema (migrated or create_all); migrated PostgreSQL schemas
+    # also bump it in the set_updated_at trigger for writes from elsewhere
+    updated_at = db.Column(db.DateTime, nullable=False, server_default=utcnow(), onupdate=utcnow())
     is_active = db.Column(db.Boolean, default=True, nullable=False)
     
     # Relationship to files
     files = db.relationship('File', back_populates='owner', lazy='dynamic', cascade='all, delete-orphan')
     
-    def set_password(self, password):
+    def set_password(self, password, method=PASSWORD_HASH_METHOD):
         """Hash and set the user's password."""
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = generate_password_hash(password, method=method)
     
     def check_password(self, password):
         """Check if the provided password matches the hash."""
@@ -38,8 +79,8 @@ class User(db.Model):
             'id': self.id,
             'username': self.username,
             'email': self.email,
-            'created_at': self.created_at.isoformat(),
-            'updated_at': self.updated_at.isoformat(),
+            'created_at': self.created_at,
+            'updated_at': self.updated_at,
             'is_active': self.is_active,
         }
         if include_files:
@@ -69,21 +110,43 @@ class File(db.Model):
     
     # Metadata
     description = db.Column(db.Text, nullable=True)
-    tags = db.Column(db.String(500), nullable=True)  # Comma-separated tags
+    # List of tags: text[] on PostgreSQL (GIN indexed); elsewhere the original
+    # comma-separated VARCHAR(500), which the migration leaves as it is
+    tags = db.Column(CommaSeparatedList().with_variant(ARRAY(db.Text), 'postgresql'), nullable=True)
     
     # Timestamps
-    uploaded_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
-    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+    uploaded_at = db.Column(db.DateTime, nullable=False, server_default=utcnow(), index=True)
+    # The database's clock is written on every UPDATE the app issues, on any
+    # dialect or schema (migrated or create_all); migrated PostgreSQL schemas
+    # also bump it in the set_updated_at trigger for writes from elsewhere
+    updated_at = db.Column(db.DateTime, nullable=False, server_default=utcnow(), onupdate=utcnow())
     last_accessed_at = db.Column(db.DateTime, nullable=True)
     
     # Status and access control
     is_public = db.Column(db.Boolean, default=False, nullable=False)
-    is_deleted = db.Column(db.Boolean, default=False, nullable=False, index=True)
+    is_deleted = db.Column(db.Boolean, default=False, nullable=False)
     deleted_at = db.Column(db.DateTime, nullable=True)
     
     # Download tracking
     download_count = db.Column(db.Integer, default=0, nullable=False)
     
+    __table_args__ = (
+        # Matches the file list query: a user's live files, newest first, with
+        # id breaking ties so ORDER BY and the keyset cursor come from the index
+        db.Index(
+            'ix_files_user_active_uploaded',
+            user_id,
+            uploaded_at.desc(),
+            id.desc(),
+            postgresql_where=(is_deleted == db.false()),
+            sqlite_where=(is_deleted == db.false()),
+        ),
+        # Tag lookups (`tags @> ARRAY[...]`) on PostgreSQL
+        db.Index(
+            'ix_files_tags_gin', tags, postgresql_using='gin', info={'dialect': 'postgresql'}
+        ).ddl_if(dialect='postgresql'),
+    )
+    
     def to_dict(self, include_owner=False):
         """Convert file to dictionary representation."""
         data = {
@@ -94,10 +157,10 @@ class File(db.Model):
             'mime_type': self.mime_type,
             'file_hash': self.file_hash,
             'description': self.description,
-            'tags': self.tags.split(',') if self.tags else [],
-            'uploaded_at': self.uploaded_at.isoformat(),
-            'updated_at': self.updated_at.isoformat(),
-            'last_accessed_at': self.last_accessed_at.isoformat() if self.last_accessed_at else None,
+            'tags': self.tags or [],
+            'uploaded_at': self.uploaded_at,
+            'updated_at': self.updated_at,
+            'last_accessed_at': self.last_accessed_at,
             'is_public': self.is_public,
             'is_deleted': self.is_deleted,
             'download_count': self.download_count,
@@ -109,21 +172,47 @@ class File(db.Model):
             }
         return data
     
+    @staticmethod
+    def list_columns():
+        """Columns needed by `serialize_rows`, for use in `select(*File.list_columns())`."""
+        return (
+            File.id,
+            File.original_filename,
+            File.file_size,
+            File.mime_type,
+            File.uploaded_at,
+            File.download_count,
+        )
+    
+    @staticmethod
+    def serialize_rows(rows):
+        """
+        Serialize rows from `select(*File.list_columns())` for the list endpoints
+        without building File instances.
+        """
+        return [{
+            'id': row.id,
+            'filename': row.original_filename,  # Return original filename to user
+            'size': row.file_size,
+            'mime_type': row.mime_type,
+            'uploaded_at': row.uploaded_at,
+            'download_count': row.download_count
+        } for row in rows]
+    
     def mark_accessed(self):
-        """Update the last accessed timestamp."""
-        self.last_accessed_at = datetime.utcnow()
-        db.session.commit()
+        """Update the last accessed timestamp (database clock). Caller must commit."""
+        self.last_accessed_at = utcnow()
     
     def increment_download_count(self):
-        """Increment the download counter."""
-        self.download_count += 1
+        """Increment the download counter. Caller must commit."""
+        # SQL-side increment, so concurrent downloads don't lose updates
+        self.download_count = File.download_count + 1
         self.mark_accessed()
     
     def soft_delete(self):
-        """Soft delete the file."""
+        """Soft delete the file. Caller must commit."""
         self.is_deleted = True
-        self.deleted_at = datetime.utcnow()
-        db.session.commit()
+        self.deleted_at = utcnow()
     
     def __repr__(self):
         return f'<File {self.filename} (User: {self.user_id})>'
@@ -173,7 +262,7 @@ class File(db.Model):
 #     def increment_access_count(self):
 #         """Increment the access counter."""
 #         self.accessed_count += 1
-#         self.last_accessed_at = datetime.utcnow()
+#         self.last_accessed_at = utcnow()
 #         db.session.commit()
     
 #     def to_dict(self):
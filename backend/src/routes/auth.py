@@ -1,11 +1,15 @@
 """
 Authentication routes for user signup, login, and logout
 """
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, current_app, request, jsonify
+from sqlalchemy import or_, select
 from sqlalchemy.exc import IntegrityError
 
 from src.models import db, User
-from src.auth import generate_token, authenticate_user, login_required, get_current_user
+from src.auth import (
+    generate_token, authenticate_user, login_required, get_current_user, login_rate_limited,
+    forget_cached_user,
+)
 
 
 auth_bp = Blueprint('auth', __name__, url_prefix='/api/auth')
@@ -58,6 +62,18 @@ def signup():
             'error': 'Username must be at least 3 characters long'
         }), 400
     
+    # Reject duplicates with an indexed lookup before spending a password hash;
+    # the unique constraints still catch a concurrent signup below
+    taken = db.session.execute(
+        select(User.id)
+        .where(or_(User.email == email, User.username == username))
+        .limit(1)
+    ).first()
+    if taken:
+        return jsonify({
+            'error': 'User with this email or username already exists'
+        }), 400
+    
     try:
         # Create new user
         user = User(
@@ -78,7 +94,7 @@ def signup():
                 'id': user.id,
                 'email': user.email,
                 'username': user.username,
-                'created_at': user.created_at.isoformat()
+                'created_at': user.created_at
             },
             'token': token
         }), 201
@@ -111,7 +127,14 @@ def login():
         200: Login successful with token
         400: Invalid request
         401: Invalid credentials
+        429: Too many login attempts
     """
+    limit = current_app.config.get('LOGIN_ATTEMPTS_PER_MINUTE')
+    if limit and login_rate_limited(request.remote_addr or 'unknown', limit):
+        return jsonify({
+            'error': 'Too many login attempts, please try again later'
+        }), 429
+    
     data = request.get_json()
     
     # Validate required fields
@@ -179,7 +202,7 @@ def get_profile(user):
             'id': user.id,
             'email': user.email,
             'username': user.username,
-            'created_at': user.created_at.isoformat()
+            'created_at': user.created_at
         }
     }), 200
 
@@ -227,6 +250,7 @@ def update_profile(user):
             user.set_password(password)
         
         db.session.commit()
+        forget_cached_user(user.id)
         
         return jsonify({
             'message': 'Profile updated successfully',
@@ -1,25 +1,139 @@
 """
 File management routes with JWT authentication
 """
+import logging
 import os
-from datetime import datetime
-from flask import Blueprint, request, jsonify, send_file, redirect
+import time
+from concurrent.futures import ThreadPoolExecutor
+from math import ceil
+from flask import Blueprint, request, jsonify, send_file, redirect, url_for
+from werkzeug.exceptions import RequestEntityTooLarge
 from werkzeug.utils import secure_filename
-from sqlalchemy import desc
+from sqlalchemy import desc, func, insert, select, update
 
-from src.models import db, File
+from src.models import db, File, utcnow
 from src.auth import login_required
 from src.storage import get_storage_service
+from src.uploads import HashingReader, uploaded_digest, uploaded_size
 from flask import current_app
 
 
 files_bp = Blueprint('files', __name__, url_prefix='/api/files')
 
+# Runs download counter updates off the request thread (pending ones finish at exit)
+_download_counter = ThreadPoolExecutor(max_workers=1, thread_name_prefix='download-count')
 
-def allowed_file(filename: str, allowed_extensions: set) -> bool:
+# Most files accepted by one batch upload, and how many go to storage at once
+MAX_BATCH_FILES = 20
+BATCH_UPLOAD_WORKERS = 5
+
+
+def allowed_file(filename: str, allowed_extensions: frozenset) -> bool:
     """Check if file extension is allowed"""
-    return '.' in filename and \
-           filename.rsplit('.', 1)[1].lower() in allowed_extensions
+    i = filename.rfind('.')
+    return i >= 0 and filename[i + 1:].lower() in allowed_extensions
+
+
+def _storage_filename(user_id: int, original_filename: str, stamp: int) -> str:
+    """
+    Unique stored filename; `stamp` is a `time.time_ns()` value, so names stay
+    sortable by upload time and distinct within the same second
+    """
+    return f"{user_id}_{stamp}_{original_filename}"
+
+
+def _stored_copies(file_hashes) -> dict:
+    """
+    Storage paths of live files already holding content with these SHA-256
+    hashes (any owner), as {file_hash: file_path}. An upload whose content is
+    already stored points its record at the existing copy instead of storing
+    the bytes again; database rows are the only references to stored files.
+    """
+    rows = db.session.execute(
+        select(File.file_hash, File.file_path)
+        .where(File.file_hash.in_(set(file_hashes)), File.is_deleted == db.false())
+    )
+    return {file_hash: file_path for file_hash, file_path in rows}
+
+
+def _owned_file_criteria(user, file_id: int) -> tuple:
+    """WHERE criteria matching `file_id` only if it is one of the user's live files"""
+    return (File.id == file_id, File.user_id == user.id, File.is_deleted == db.false())
+
+
+def _unowned_file_response(user, file_id: int, action: str):
+    """
+    Error response for a query scoped by `_owned_file_criteria` that matched
+    no row: 404 if the file doesn't exist (or is deleted), 403 if it belongs
+    to someone else
+    """
+    owner_id = db.session.scalar(
+        select(File.user_id).where(File.id == file_id, File.is_deleted == db.false())
+    )
+    
+    if owner_id is None:
+        return jsonify({'error': 'File not found'}), 404
+    
+    return jsonify({'error': f'Not authorized to {action} this file'}), 403
+
+
+def _record_download(response, file_id: int):
+    """
+    Increment the file's download count on a background thread, so the
+    UPDATE and its commit overlap with sending `response` instead of
+    delaying it
+    """
+    app = current_app._get_current_object()
+    
+    def record():
+        with app.app_context():
+            try:
+                db.session.execute(
+                    update(File)
+                    .where(File.id == file_id)
+                    .values(
+                        download_count=File.download_count + 1,
+                        last_accessed_at=utcnow()
+                    )
+                )
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                app.logger.error("Failed to record download of file %s: %s", file_id, e)
+    
+    _download_counter.submit(record)
+    return response
+
+
+_UPLOAD_ENDPOINTS = frozenset(('files.upload_file', 'files.upload_files', 'files.upload_stream'))
+
+
+def _too_large_response():
+    """413 for an upload over MAX_CONTENT_LENGTH"""
+    return jsonify({
+        'error': 'File too large',
+        'max_size': current_app.config.get('MAX_CONTENT_LENGTH')
+    }), 413
+
+
+@files_bp.before_request
+def _reject_unparseable_upload():
+    """
+    Turn away uploads that are too large or not multipart from the headers
+    alone, before authentication or any body parsing runs
+    """
+    if request.endpoint not in _UPLOAD_ENDPOINTS or request.method not in ('POST', 'PUT'):
+        return None
+    
+    max_length = current_app.config.get('MAX_CONTENT_LENGTH')
+    if max_length and request.content_length and request.content_length > max_length:
+        return _too_large_response()
+    
+    # Raw uploads take any content type (it becomes the file's MIME type)
+    if request.endpoint != 'files.upload_stream' and request.mimetype != 'multipart/form-data':
+        return jsonify({'error': 'Content-Type must be multipart/form-data'}), 415
+    
+    return None
 
 
 @files_bp.route('', methods=['POST'])
@@ -35,70 +149,72 @@ def upload_file(user):
         201: File uploaded successfully
         400: No file provided or invalid file
         413: File too large
+        415: Request is not multipart/form-data
     """
+    logger = current_app.logger
+    
     # Log request details
-    current_app.logger.info(f"=== FILE UPLOAD REQUEST ===")
-    current_app.logger.info(f"User ID: {user.id}")
-    current_app.logger.info(f"Content-Type: {request.content_type}")
-    current_app.logger.info(f"Content-Length: {request.content_length}")
-    current_app.logger.info(f"MAX_CONTENT_LENGTH config: {current_app.config.get('MAX_CONTENT_LENGTH')}")
-    current_app.logger.info(f"Request files: {list(request.files.keys())}")
+    logger.info("File upload request from user %s (Content-Length: %s)", user.id, request.content_length)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Content-Type: %s", request.content_type)
+        logger.debug("MAX_CONTENT_LENGTH config: %s", current_app.config.get('MAX_CONTENT_LENGTH'))
+        logger.debug("Request files: %s", list(request.files.keys()))
     
     # Check if file is in request
     if 'file' not in request.files:
-        current_app.logger.error("No file provided in request")
+        logger.warning("No file provided in request")
         return jsonify({'error': 'No file provided'}), 400
     
     file = request.files['file']
     
     # Check if filename is empty
     if file.filename == '':
-        current_app.logger.error("Empty filename")
+        logger.warning("Empty filename")
         return jsonify({'error': 'No file selected'}), 400
     
     # Get allowed extensions from config
     allowed_extensions = current_app.config.get('ALLOWED_EXTENSIONS')
-    current_app.logger.info(f"Allowed extensions config: {allowed_extensions}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Allowed extensions config: %s", allowed_extensions and sorted(allowed_extensions))
     
     # If ALLOWED_EXTENSIONS is None or empty, allow all file types
     if allowed_extensions and not allowed_file(file.filename, allowed_extensions):
-        current_app.logger.error(f"File type not allowed: {file.filename}")
+        logger.warning("File type not allowed: %s", file.filename)
         return jsonify({
             'error': 'File type not allowed',
-            'allowed_types': list(allowed_extensions)
+            'allowed_types': sorted(allowed_extensions)
         }), 400
     
     try:
-        current_app.logger.info(f"Starting file upload for user {user.id}")
-        current_app.logger.debug(f"Original filename: {file.filename}")
-        current_app.logger.debug(f"Content type: {file.content_type}")
+        logger.debug("Original filename: %s", file.filename)
+        logger.debug("Content type: %s", file.content_type)
         
         # Secure the filename
         original_filename = secure_filename(file.filename)
         
         # Generate unique filename to avoid conflicts
-        timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
-        filename = f"{user.id}_{timestamp}_{original_filename}"
-        current_app.logger.debug(f"Generated unique filename: {filename}")
-        
-        # Get storage service
-        storage = get_storage_service()
-        current_app.logger.info(f"Storage service initialized, mode: {storage.storage_mode}")
-        
-        # Upload file to storage (local or Supabase)
-        current_app.logger.info("Calling storage.upload_file()")
-        storage_path = storage.upload_file(file, user.id, filename)
-        current_app.logger.info(f"Storage upload result: {storage_path}")
+        filename = _storage_filename(user.id, original_filename, time.time_ns())
+        logger.debug("Generated unique filename: %s", filename)
         
-        if not storage_path:
-            current_app.logger.error("Storage upload returned None/empty path")
-            return jsonify({'error': 'Failed to upload file to storage'}), 500
+        # Get file size and hash (computed while the upload was parsed)
+        file_size = uploaded_size(file)
+        file_hash = uploaded_digest(file)
         
-        # Get file size
-        file.seek(0, 2)  # Seek to end
-        file_size = file.tell()
-        file.seek(0)  # Reset to beginning
-        current_app.logger.info(f"File size: {file_size} bytes ({file_size / 1024 / 1024:.2f} MB)")
+        # Same content already stored: reuse it rather than uploading again
+        storage_path = _stored_copies([file_hash]).get(file_hash)
+        if storage_path:
+            logger.debug("Reusing stored copy %s", storage_path)
+        else:
+            # Get storage service
+            storage = get_storage_service()
+            
+            # Upload file to storage (local or Supabase)
+            storage_path = storage.upload_file(file, user.id, filename)
+            logger.debug("Storage upload result (%s): %s", storage.storage_mode, storage_path)
+            
+            if not storage_path:
+                logger.error("Storage upload returned None/empty path")
+                return jsonify({'error': 'Failed to upload file to storage'}), 500
         
         # Create database record
         new_file = File(
@@ -107,13 +223,14 @@ def upload_file(user):
             file_path=storage_path,  # Store the storage path (local path or Supabase bucket path)
             file_size=file_size,
             mime_type=file.content_type or 'application/octet-stream',
+            file_hash=file_hash,
             user_id=user.id
         )
         
         db.session.add(new_file)
         db.session.commit()
         
-        current_app.logger.info(f"File record created in database with ID: {new_file.id}")
+        logger.info("Stored file %s for user %s (%s bytes)", new_file.id, user.id, file_size)
         
         return jsonify({
             'message': 'File uploaded successfully',
@@ -122,19 +239,229 @@ def upload_file(user):
                 'filename': new_file.original_filename,  # Return original filename to user
                 'size': new_file.file_size,
                 'mime_type': new_file.mime_type,
-                'uploaded_at': new_file.uploaded_at.isoformat()
+                'uploaded_at': new_file.uploaded_at
             }
         }), 201
         
     except Exception as e:
         db.session.rollback()
-        current_app.logger.error(f"File upload failed: {str(e)}")
-        current_app.logger.exception("Full traceback:")
+        logger.exception("File upload failed: %s", e)
+        return jsonify({
+            'error': 'Failed to upload file',
+            'message': str(e),
+            'type': type(e).__name__
+        }), 500
+
+
+@files_bp.route('/<string:name>', methods=['PUT'])
+@login_required
+def upload_stream(user, name):
+    """
+    Upload a file sent as the raw request body
+    
+    The body goes to storage in 1 MB chunks without being parsed as multipart
+    or spooled to a temp file first, so it's the faster way to send large files.
+    
+    Request:
+        - Body: the file content
+        - Content-Type: the file's MIME type (default: application/octet-stream)
+    
+    Returns:
+        201: File uploaded successfully
+        400: Invalid filename or file type not allowed
+        413: File too large
+    """
+    logger = current_app.logger
+    
+    original_filename = secure_filename(name)
+    if not original_filename:
+        return jsonify({'error': 'Invalid filename'}), 400
+    
+    # If ALLOWED_EXTENSIONS is None or empty, allow all file types
+    allowed_extensions = current_app.config.get('ALLOWED_EXTENSIONS')
+    if allowed_extensions and not allowed_file(original_filename, allowed_extensions):
+        logger.warning("File type not allowed: %s", name)
+        return jsonify({
+            'error': 'File type not allowed',
+            'allowed_types': sorted(allowed_extensions)
+        }), 400
+    
+    mime_type = request.mimetype or 'application/octet-stream'
+    filename = _storage_filename(user.id, original_filename, time.time_ns())
+    
+    storage = get_storage_service()
+    # Hashed on the way through, so later uploads of the same content can reuse it
+    body = HashingReader(request.stream)
+    try:
+        result = storage.upload_stream(body, user.id, filename, mime_type, request.content_length)
+    except RequestEntityTooLarge:
+        # A chunked body (no Content-Length) ran over MAX_CONTENT_LENGTH
+        logger.warning("Stream upload over the size limit for user %s", user.id)
+        return _too_large_response()
+    
+    if not result:
+        logger.error("Storage stream upload failed for user %s", user.id)
+        return jsonify({'error': 'Failed to upload file to storage'}), 500
+    
+    storage_path, file_size = result
+    file_hash = body.sha256.hexdigest()
+    
+    # The hash is only known once the body has been read, so content that
+    # is already stored gets uploaded anyway; drop this copy and share that one
+    stored_path = _stored_copies([file_hash]).get(file_hash)
+    if stored_path:
+        storage.delete_file(storage_path)
+        storage_path = stored_path
+    
+    try:
+        new_file = File(
+            filename=filename,
+            original_filename=original_filename,
+            file_path=storage_path,
+            file_size=file_size,
+            mime_type=mime_type,
+            file_hash=file_hash,
+            user_id=user.id
+        )
+        
+        db.session.add(new_file)
+        db.session.commit()
+        
+    except Exception as e:
+        db.session.rollback()
+        logger.exception("File upload failed: %s", e)
+        if not stored_path:
+            storage.delete_file(storage_path)
         return jsonify({
             'error': 'Failed to upload file',
             'message': str(e),
             'type': type(e).__name__
         }), 500
+    
+    logger.info("Stored file %s for user %s (%s bytes)", new_file.id, user.id, file_size)
+    
+    return jsonify({
+        'message': 'File uploaded successfully',
+        'file': {
+            'id': new_file.id,
+            'filename': new_file.original_filename,
+            'size': new_file.file_size,
+            'mime_type': new_file.mime_type,
+            'uploaded_at': new_file.uploaded_at
+        }
+    }), 201
+
+
+@files_bp.route('/batch', methods=['POST'])
+@login_required
+def upload_files(user):
+    """
+    Upload several files in one request
+    
+    Storage uploads run concurrently and the database records are written
+    with a single multi-row INSERT and commit. The batch is all or nothing.
+    
+    Request:
+        - multipart/form-data with one or more 'file' fields
+    
+    Returns:
+        201: All files uploaded successfully
+        400: No files provided, too many files, or a file type not allowed
+        413: Request too large
+        415: Request is not multipart/form-data
+        500: Upload failed (none of the files are kept)
+    """
+    logger = current_app.logger
+    
+    files = [file for file in request.files.getlist('file') if file.filename]
+    
+    if not files:
+        return jsonify({'error': 'No file provided'}), 400
+    
+    if len(files) > MAX_BATCH_FILES:
+        return jsonify({
+            'error': f'Too many files, at most {MAX_BATCH_FILES} per request'
+        }), 400
+    
+    # If ALLOWED_EXTENSIONS is None or empty, allow all file types
+    allowed_extensions = current_app.config.get('ALLOWED_EXTENSIONS')
+    if allowed_extensions:
+        rejected = [file.filename for file in files if not allowed_file(file.filename, allowed_extensions)]
+        if rejected:
+            logger.warning("File types not allowed: %s", rejected)
+            return jsonify({
+                'error': 'File type not allowed',
+                'files': rejected,
+                'allowed_types': sorted(allowed_extensions)
+            }), 400
+    
+    storage = get_storage_service()
+    original_filenames = [secure_filename(file.filename) for file in files]
+    # Consecutive stamps keep names distinct even for repeated filenames
+    stamp = time.time_ns()
+    filenames = [
+        _storage_filename(user.id, name, stamp + i)
+        for i, name in enumerate(original_filenames)
+    ]
+    
+    # Content already stored (or repeated within the batch) is uploaded once;
+    # the rest goes to storage (local or Supabase) concurrently
+    file_hashes = [uploaded_digest(file) for file in files]
+    stored = _stored_copies(file_hashes)
+    pending = {}
+    for file, filename, file_hash in zip(files, filenames, file_hashes):
+        if file_hash not in stored:
+            pending.setdefault(file_hash, (file, filename))
+    
+    uploaded = {}
+    if pending:
+        with ThreadPoolExecutor(max_workers=min(BATCH_UPLOAD_WORKERS, len(pending))) as pool:
+            uploaded = dict(zip(pending, pool.map(
+                lambda args: storage.upload_file(args[0], user.id, args[1]),
+                pending.values()
+            )))
+    
+    if not all(uploaded.values()):
+        logger.error("Batch upload failed for user %s, removing the stored files", user.id)
+        storage.delete_files([storage_path for storage_path in uploaded.values() if storage_path])
+        return jsonify({'error': 'Failed to upload file to storage'}), 500
+    
+    stored.update(uploaded)
+    
+    try:
+        # One multi-row INSERT for the whole batch
+        rows = db.session.execute(
+            insert(File).returning(*File.list_columns(), sort_by_parameter_order=True),
+            [{
+                'filename': filename,
+                'original_filename': original_filename,
+                'file_path': storage_path,
+                'file_size': uploaded_size(file),
+                'mime_type': file.content_type or 'application/octet-stream',
+                'file_hash': file_hash,
+                'user_id': user.id
+            } for file, filename, original_filename, file_hash, storage_path
+                in zip(files, filenames, original_filenames, file_hashes, map(stored.get, file_hashes))]
+        ).all()
+        db.session.commit()
+        
+    except Exception as e:
+        db.session.rollback()
+        logger.exception("Batch upload failed: %s", e)
+        if uploaded:
+            storage.delete_files(list(uploaded.values()))
+        return jsonify({
+            'error': 'Failed to upload files',
+            'message': str(e),
+            'type': type(e).__name__
+        }), 500
+    
+    logger.info("Stored %s files for user %s", len(rows), user.id)
+    
+    return jsonify({
+        'message': 'Files uploaded successfully',
+        'files': File.serialize_rows(rows)
+    }), 201
 
 
 @files_bp.route('', methods=['GET'])
@@ -146,6 +473,8 @@ def list_files(user):
     Query params:
         - page: Page number (default: 1)
         - size: Items per page (default: 10, max: 100)
+        - cursor: ID of the last file of the previous page; when given,
+          returns the files listed after it instead of a numbered page
     
     Returns:
         200: List of files
@@ -153,41 +482,82 @@ def list_files(user):
     # Get pagination parameters
     page = request.args.get('page', 1, type=int)
     size = request.args.get('size', 10, type=int)
+    cursor = request.args.get('cursor', type=int)
+    
+    # Clamp page number and page size
+    page = max(page, 1)
+    size = min(size, 100) if size > 0 else 10
+    
+    # Files owned by current user (exclude deleted)
+    # `is_deleted = false` so PostgreSQL can use the partial list index
+    criteria = (File.user_id == user.id, File.is_deleted == db.false())
+    
+    # `id` breaks ties between files uploaded in the same instant
+    order = (desc(File.uploaded_at), desc(File.id))
+    
+    if cursor is not None:
+        # Keyset pagination: seek past the cursor file in the index instead
+        # of scanning and discarding OFFSET rows
+        anchor = (
+            select(File.uploaded_at)
+            .where(File.id == cursor, File.user_id == user.id)
+            .scalar_subquery()
+        )
+        rows = db.session.execute(
+            select(*File.list_columns())
+            .where(
+                *criteria,
+                File.uploaded_at <= anchor,
+                (File.uploaded_at < anchor) | (File.id < cursor)
+            )
+            .order_by(*order)
+            .limit(size + 1)
+        ).all()
+        
+        has_next = len(rows) > size
+        rows = rows[:size]
+        
+        return jsonify({
+            'files': File.serialize_rows(rows),
+            'pagination': {
+                'size': size,
+                'has_next': has_next,
+                'next_cursor': rows[-1].id if has_next else None
+            }
+        }), 200
     
-    # Limit page size
-    size = min(size, 100)
-    
-    # Query files owned by current user (exclude deleted)
-    query = File.query.filter_by(
-        user_id=user.id,
-        is_deleted=False
-    ).order_by(desc(File.uploaded_at))
-    
-    # Paginate
-    pagination = query.paginate(
-        page=page,
-        per_page=size,
-        error_out=False
-    )
+    # Select only the listed columns so no File instances are built; the
+    # extra row tells whether there is a next page
+    offset = (page - 1) * size
+    rows = db.session.execute(
+        select(*File.list_columns())
+        .where(*criteria)
+        .order_by(*order)
+        .limit(size + 1)
+        .offset(offset)
+    ).all()
+    
+    if len(rows) <= size and (rows or offset == 0):
+        # Last page: the total follows without a COUNT(*)
+        total = offset + len(rows)
+    else:
+        total = db.session.scalar(
+            select(func.count()).select_from(File).where(*criteria)
+        )
+    rows = rows[:size]
     
-    files = [{
-        'id': f.id,
-        'filename': f.original_filename,  # Return original filename to user
-        'size': f.file_size,
-        'mime_type': f.mime_type,
-        'uploaded_at': f.uploaded_at.isoformat(),
-        'download_count': f.download_count
-    } for f in pagination.items]
+    pages = ceil(total / size)
     
     return jsonify({
-        'files': files,
+        'files': File.serialize_rows(rows),
         'pagination': {
-            'page': pagination.page,
-            'size': pagination.per_page,
-            'total': pagination.total,
-            'pages': pagination.pages,
-            'has_next': pagination.has_next,
-            'has_prev': pagination.has_prev
+            'page': page,
+            'size': size,
+            'total': total,
+            'pages': pages,
+            'has_next': page < pages,
+            'has_prev': page > 1,
+            'next_cursor': rows[-1].id if page < pages and rows else None
         }
     }), 200
 
@@ -203,24 +573,15 @@ def get_file(user, file_id):
         403: Not authorized
         404: File not found
     """
-    file = db.session.get(File, file_id)
+    row = db.session.execute(
+        select(*File.list_columns()).where(*_owned_file_criteria(user, file_id))
+    ).first()
     
-    if not file or file.is_deleted:
-        return jsonify({'error': 'File not found'}), 404
-    
-    # Check ownership
-    if file.user_id != user.id:
-        return jsonify({'error': 'Not authorized to access this file'}), 403
+    if row is None:
+        return _unowned_file_response(user, file_id, 'access')
     
     return jsonify({
-        'file': {
-            'id': file.id,
-            'filename': file.original_filename,  # Return original filename to user
-            'size': file.file_size,
-            'mime_type': file.mime_type,
-            'uploaded_at': file.uploaded_at.isoformat(),
-            'download_count': file.download_count
-        }
+        'file': File.serialize_rows([row])[0]
     }), 200
 
 
@@ -232,47 +593,114 @@ def download_file(user, file_id):
     
     Returns:
         200: File content (for local storage)
+        206: Partial file content (for local storage Range requests)
+        304: Not modified (for local storage conditional requests)
         302: Redirect to signed URL (for Supabase storage)
         403: Not authorized
         404: File not found
     """
-    file = db.session.get(File, file_id)
-    
-    if not file or file.is_deleted:
-        return jsonify({'error': 'File not found'}), 404
+    file = db.session.execute(
+        select(
+            File.id,
+            File.file_path,
+            File.original_filename,
+            File.mime_type,
+            File.file_size,
+            File.uploaded_at
+        )
+        .where(*_owned_file_criteria(user, file_id))
+    ).first()
     
-    # Check ownership
-    if file.user_id != user.id:
-        return jsonify({'error': 'Not authorized to download this file'}), 403
+    if file is None:
+        return _unowned_file_response(user, file_id, 'download')
     
     # Get storage service
     storage = get_storage_service()
     
     # Get download info based on storage mode
-    signed_url, file_bytes = storage.get_download_info(file.file_path)
-    
-    # Increment download count
-    file.download_count += 1
-    db.session.commit()
+    signed_url, local_path = storage.get_download_info(file.file_path)
     
     if storage.is_using_supabase():
         # For Supabase, redirect to the signed URL
         if signed_url:
-            return redirect(signed_url)
+            return _record_download(redirect(signed_url), file.id)
         else:
             return jsonify({'error': 'Failed to generate download URL'}), 500
+    
+    # For local storage, stream the file from disk; `conditional` adds
+    # Range (206) and If-None-Match/If-Modified-Since (304) support.
+    # Stored files never change, so the validators come from the record.
+    if not local_path:
+        return jsonify({'error': 'File not found on server'}), 404
+    
+    try:
+        # send_file stats the file anyway, so a missing one is caught here
+        # rather than checked for up front
+        response = send_file(
+            local_path,
+            as_attachment=True,
+            download_name=file.original_filename,
+            mimetype=file.mime_type,
+            conditional=True,
+            etag=f"{file.id}-{file.file_size}",
+            last_modified=file.uploaded_at
+        )
+    except FileNotFoundError:
+        current_app.logger.error("File missing from local storage: %s", file.file_path)
+        return jsonify({'error': 'File not found on server'}), 404
+    
+    # Only the owner may reuse it, and only after revalidating
+    response.cache_control.private = True
+    if response.status_code == 304:
+        # Served from the client's cache; not a new download
+        return response
+    return _record_download(response, file.id)
+
+
+@files_bp.route('/download-urls', methods=['POST'])
+@login_required
+def download_urls(user):
+    """
+    Get download URLs for several files at once
+    
+    With Supabase storage the URLs are signed, and the ones not already
+    cached are signed together in one request rather than one per file.
+    With local storage they point at the download endpoint.
+    
+    Request body:
+        {
+            "ids": [1, 2, 3]
+        }
+    
+    Returns:
+        200: {"urls": {file_id: url}}; files that don't exist, aren't the
+             user's, or couldn't be signed are left out
+        400: Invalid request or too many files
+    """
+    data = request.get_json(silent=True) or {}
+    file_ids = data.get('ids')
+    
+    if not isinstance(file_ids, list) or not all(isinstance(file_id, int) for file_id in file_ids):
+        return jsonify({'error': 'ids must be a list of file ids'}), 400
+    
+    if len(file_ids) > MAX_BATCH_FILES:
+        return jsonify({
+            'error': f'Too many files, at most {MAX_BATCH_FILES} per request'
+        }), 400
+    
+    rows = db.session.execute(
+        select(File.id, File.file_path)
+        .where(File.id.in_(file_ids), File.user_id == user.id, File.is_deleted == db.false())
+    ).all()
+    
+    storage = get_storage_service()
+    if storage.is_using_supabase():
+        signed_urls = storage.get_signed_urls([row.file_path for row in rows])
+        urls = {str(row.id): signed_urls[row.file_path] for row in rows if row.file_path in signed_urls}
     else:
-        # For local storage, send the file directly
-        if file_bytes:
-            from io import BytesIO
-            return send_file(
-                BytesIO(file_bytes),
-                as_attachment=True,
-                download_name=file.original_filename,
-                mimetype=file.mime_type
-            )
-        else:
-            return jsonify({'error': 'File not found on server'}), 404
+        urls = {str(row.id): url_for('files.download_file', file_id=row.id) for row in rows}
+    
+    return jsonify({'urls': urls}), 200
 
 
 @files_bp.route('/<int:file_id>', methods=['PATCH'])
@@ -292,15 +720,6 @@ def rename_file(user, file_id):
         403: Not authorized
         404: File not found
     """
-    file = db.session.get(File, file_id)
-    
-    if not file or file.is_deleted:
-        return jsonify({'error': 'File not found'}), 404
-    
-    # Check ownership
-    if file.user_id != user.id:
-        return jsonify({'error': 'Not authorized to rename this file'}), 403
-    
     data = request.get_json()
     
     if not data or 'filename' not in data:
@@ -312,17 +731,28 @@ def rename_file(user, file_id):
         return jsonify({'error': 'Filename cannot be empty'}), 400
     
     try:
-        # Update original filename (the one shown to user)
-        file.original_filename = secure_filename(new_filename)
+        # Update original filename (the one shown to user) in a single
+        # UPDATE scoped to the user's live files
+        renamed = db.session.execute(
+            update(File)
+            .where(*_owned_file_criteria(user, file_id))
+            .values(original_filename=secure_filename(new_filename))
+            .returning(File.id, File.original_filename, File.file_size, File.mime_type)
+        ).first()
+        
+        if renamed is None:
+            db.session.rollback()
+            return _unowned_file_response(user, file_id, 'rename')
+        
         db.session.commit()
         
         return jsonify({
             'message': 'File renamed successfully',
             'file': {
-                'id': file.id,
-                'filename': file.original_filename,
-                'size': file.file_size,
-                'mime_type': file.mime_type
+                'id': renamed.id,
+                'filename': renamed.original_filename,
+                'size': renamed.file_size,
+                'mime_type': renamed.mime_type
             }
         }), 200
         
@@ -345,26 +775,24 @@ def delete_file(user, file_id):
         403: Not authorized
         404: File not found
     """
-    file = db.session.get(File, file_id)
-    
-    if not file or file.is_deleted:
-        return jsonify({'error': 'File not found'}), 404
-    
-    # Check ownership
-    if file.user_id != user.id:
-        return jsonify({'error': 'Not authorized to delete this file'}), 403
-    
     try:
-        # Get storage service
-        storage = get_storage_service()
+        # Soft delete in database with a single UPDATE scoped to the user's live files
+        deleted_id = db.session.execute(
+            update(File)
+            .where(*_owned_file_criteria(user, file_id))
+            .values(is_deleted=True, deleted_at=utcnow())
+            .returning(File.id)
+        ).scalar()
         
-        # Delete from storage (optional - you might want to keep files in storage)
-        # storage.delete_file(file.file_path)
+        if deleted_id is None:
+            db.session.rollback()
+            return _unowned_file_response(user, file_id, 'delete')
         
-        # Soft delete in database
-        file.is_deleted = True
         db.session.commit()
         
+        # The stored copy is kept: deletes are soft, and records with the same
+        # content share one copy (see _stored_copies)
+        
         return jsonify({
             'message': 'File deleted successfully'
         }), 200
@@ -374,4 +802,4 @@ def delete_file(user, file_id):
         return jsonify({
             'error': 'Failed to delete file',
             'message': str(e)
-        }), 500
\ No newline at end of file
+        }), 500
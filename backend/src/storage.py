@@ -1,10 +1,17 @@
 import os
-from typing import Optional, Tuple
+import threading
+import time
+from collections import OrderedDict
+from typing import IO, Dict, List, Optional, Tuple
 from werkzeug.datastructures import FileStorage
+from werkzeug.exceptions import HTTPException
+from werkzeug.security import safe_join
 from werkzeug.utils import secure_filename
 import logging
 from flask import current_app
 
+from src.uploads import UPLOAD_BUFFER_SIZE, preallocate, save_upload
+
 logger = logging.getLogger(__name__)
 
 # Try to import Supabase, but don't fail if it's not available
@@ -16,34 +23,53 @@ except ImportError:
     SUPABASE_AVAILABLE = False
     logger.info("Supabase not available, using local storage only")
 
+# Signed download URLs are valid this long, and reused until a minute before
+# they expire; at most SIGNED_URL_CACHE_SIZE are kept (least recently used go)
+SIGNED_URL_EXPIRES_IN = 3600
+SIGNED_URL_REUSE_MARGIN = 60
+SIGNED_URL_CACHE_SIZE = 4096
+
 class StorageService:
     """Service for handling file storage operations with both local and Supabase Storage"""
     
-    def __init__(self):
-        self.storage_mode = os.getenv('STORAGE_MODE', 'local').lower()  # 'local' or 'supabase'
+    def __init__(self, config=None):
+        """
+        Args:
+            config: Mapping with the STORAGE_MODE, SUPABASE_* and UPLOAD_FOLDER
+                settings (defaults to the current app's config)
+        """
+        if config is None:
+            config = current_app.config
+        
+        self.storage_mode = config['STORAGE_MODE']  # 'local' or 'supabase'
+        # Set once the Supabase bucket is known to exist, so it's checked once per process
+        self._bucket_verified = False
+        # storage_path -> (signed_url, reuse_until on the monotonic clock)
+        self._signed_urls = OrderedDict()
+        self._signed_urls_lock = threading.Lock()
         
         # Use Flask's logger if available, otherwise use module logger
         self.logger = current_app.logger if current_app else logger
         
-        self.logger.info(f"Initializing StorageService with mode: {self.storage_mode}")
+        self.logger.info("Initializing StorageService with mode: %s", self.storage_mode)
         
         if self.storage_mode == 'supabase':
             if not SUPABASE_AVAILABLE:
                 self.logger.warning("Supabase storage requested but supabase-py not installed. Falling back to local storage.")
                 self.storage_mode = 'local'
             else:
-                self.supabase_url = os.getenv('SUPABASE_URL')
-                self.supabase_key = os.getenv('SUPABASE_SERVICE_KEY')
-                self.bucket_name = os.getenv('SUPABASE_STORAGE_BUCKET', 'files')
+                self.supabase_url = config['SUPABASE_URL']
+                self.supabase_key = config['SUPABASE_SERVICE_KEY']
+                self.bucket_name = config['SUPABASE_STORAGE_BUCKET']
                 
-                self.logger.debug(f"Supabase URL: {self.supabase_url}")
-                self.logger.debug(f"Supabase key present: {bool(self.supabase_key)}")
-                self.logger.debug(f"Bucket name: {self.bucket_name}")
+                self.logger.debug("Supabase URL: %s", self.supabase_url)
+                self.logger.debug("Supabase key present: %s", bool(self.supabase_key))
+                self.logger.debug("Bucket name: %s", self.bucket_name)
                 
                 if not self.supabase_url or not self.supabase_key:
                     self.logger.warning("Supabase credentials not found. Falling back to local storage.")
-                    self.logger.debug(f"SUPABASE_URL present: {bool(self.supabase_url)}")
-                    self.logger.debug(f"SUPABASE_SERVICE_KEY present: {bool(self.supabase_key)}")
+                    self.logger.debug("SUPABASE_URL present: %s", bool(self.supabase_url))
+                    self.logger.debug("SUPABASE_SERVICE_KEY present: %s", bool(self.supabase_key))
                     self.storage_mode = 'local'
                 else:
                     try:
@@ -51,49 +77,34 @@ class StorageService:
                         url = str(self.supabase_url) if self.supabase_url else ""
                         key = str(self.supabase_key) if self.supabase_key else ""
                         
-                        self.logger.debug(f"Creating Supabase client with URL type: {type(url)}, key type: {type(key)}")
+                        self.logger.debug("Creating Supabase client with URL type: %s, key type: %s", type(url), type(key))
                         
                         # Use the fixed client creation to prevent header encoding issues
                         self.client: Client = create_fixed_supabase_client(url, key)
                         self.logger.info("Supabase client created successfully with header fixes applied")
                         
-                        # Patch the client to ensure headers are strings
-                        if hasattr(self.client, 'storage') and hasattr(self.client.storage, '_client'):
-                            storage_client = self.client.storage._client
-                            if hasattr(storage_client, '_headers'):
-                                # Convert any boolean headers to strings
-                                original_headers = storage_client._headers.copy()
-                                for key, value in original_headers.items():
-                                    if isinstance(value, bool):
-                                        self.logger.info(f"FOUND BOOLEAN HEADER during init - {key}: {value}, converting to string")
-                                        storage_client._headers[key] = str(value).lower()
-                                    elif value is None:
-                                        self.logger.info(f"Found None header during init - {key}, converting to empty string")
-                                        storage_client._headers[key] = ""
-                                    elif not isinstance(value, str):
-                                        self.logger.info(f"Found non-string header during init - {key}: {value} (type: {type(value)}), converting to string")
-                                        storage_client._headers[key] = str(value)
-                        
                         self._ensure_bucket_exists()
                     except Exception as e:
-                        self.logger.error(f"Failed to create Supabase client: {str(e)}")
-                        self.logger.exception("Full traceback:")
+                        self.logger.exception("Failed to create Supabase client: %s", e)
                         self.storage_mode = 'local'
         
         if self.storage_mode == 'local':
-            self.upload_folder = os.getenv('UPLOAD_FOLDER', 'uploads')
+            # Resolved once so per-request paths don't depend on the cwd
+            self.upload_folder = os.path.abspath(config['UPLOAD_FOLDER'])
+            # Per-user directories already created by this process
+            self._user_dirs = set()
             try:
                 os.makedirs(self.upload_folder, exist_ok=True)
-                self.logger.info(f"Using local storage in folder: {self.upload_folder}")
+                self.logger.info("Using local storage in folder: %s", self.upload_folder)
             except Exception as e:
-                self.logger.error(f"Failed to create upload folder: {str(e)}")
+                self.logger.error("Failed to create upload folder: %s", e)
                 raise
         else:
             self.logger.info("Using Supabase storage")
     
     def _ensure_bucket_exists(self):
         """Ensure the storage bucket exists, create if it doesn't"""
-        if self.storage_mode != 'supabase':
+        if self.storage_mode != 'supabase' or self._bucket_verified:
             return
             
         try:
@@ -104,21 +115,29 @@ class StorageService:
             else:
                 # If it's not a list, try to extract bucket info differently
                 bucket_names = []
-                self.logger.warning(f"Unexpected bucket list format: {type(buckets)}")
+                self.logger.warning("Unexpected bucket list format: %s", type(buckets))
             
             if self.bucket_name not in bucket_names:
                 # Create bucket with minimal options
                 try:
                     self.client.storage.create_bucket(self.bucket_name)
-                    self.logger.info(f"Created storage bucket: {self.bucket_name}")
+                    self.logger.info("Created storage bucket: %s", self.bucket_name)
+                    self._bucket_verified = True
                 except Exception as create_error:
-                    # Bucket might already exist
-                    self.logger.info(f"Bucket creation skipped: {create_error}")
+                    # A 409 means it was created concurrently (or isn't listed
+                    # to this key); anything else is retried on the next call
+                    message = str(create_error)
+                    if '409' in message or 'already exists' in message.lower():
+                        self.logger.info("Storage bucket already exists: %s", self.bucket_name)
+                        self._bucket_verified = True
+                    else:
+                        self.logger.warning("Error creating bucket: %s", message)
             else:
-                self.logger.info(f"Storage bucket already exists: {self.bucket_name}")
+                self.logger.info("Storage bucket already exists: %s", self.bucket_name)
+                self._bucket_verified = True
         except Exception as e:
             # Log the error but don't fail - bucket operations might not be critical
-            self.logger.warning(f"Error checking/creating bucket: {str(e)}")
+            self.logger.warning("Error checking/creating bucket: %s", e)
     
     def upload_file(self, file: FileStorage, user_id: int, filename: str) -> Optional[str]:
         """
@@ -140,137 +159,277 @@ class StorageService:
         else:
             return self._upload_supabase(file, storage_path)
     
+    def upload_stream(self, stream: IO[bytes], user_id: int, filename: str,
+                      content_type: str, content_length: Optional[int] = None) -> Optional[Tuple[str, int]]:
+        """
+        Upload a raw (non-multipart) request body to storage (local or Supabase),
+        reading it in UPLOAD_BUFFER_SIZE chunks without spooling it first
+        
+        Args:
+            stream: The request body stream
+            user_id: The ID of the user uploading the file
+            filename: The unique filename to use for storage
+            content_type: MIME type of the body
+            content_length: Expected body size, if known (used to preallocate
+                local files)
+            
+        Returns:
+            Tuple of (storage path, bytes written) if successful, None otherwise
+        
+        Raises:
+            HTTPException: Reading the body failed on the client's side, e.g.
+                RequestEntityTooLarge for a chunked body over MAX_CONTENT_LENGTH
+        """
+        storage_path = f"user_{user_id}/{filename}"
+        
+        if self.storage_mode == 'local':
+            return self._upload_stream_local(stream, storage_path, content_length)
+        else:
+            return self._upload_stream_supabase(stream, storage_path, content_type)
+    
+    def _local_upload_path(self, storage_path: str) -> str:
+        """Full path for a new local file, creating its user directory once per process"""
+        # Same traversal check as reads and deletes: never write outside the folder
+        file_path = safe_join(self.upload_folder, storage_path)
+        if file_path is None:
+            raise ValueError(f"Storage path outside the upload folder: {storage_path}")
+        
+        user_dir = os.path.dirname(file_path)
+        if user_dir not in self._user_dirs:
+            os.makedirs(user_dir, exist_ok=True)
+            self._user_dirs.add(user_dir)
+        
+        return file_path
+    
+    def _upload_stream_local(self, stream: IO[bytes], storage_path: str,
+                             content_length: Optional[int] = None) -> Optional[Tuple[str, int]]:
+        """Write a request body stream to local storage"""
+        file_path = None
+        try:
+            file_path = self._local_upload_path(storage_path)
+            size = 0
+            
+            with open(file_path, 'wb') as dst:
+                preallocated = preallocate(dst.fileno(), content_length)
+                for chunk in iter(lambda: stream.read(UPLOAD_BUFFER_SIZE), b''):
+                    dst.write(chunk)
+                    size += len(chunk)
+                if preallocated:
+                    # Drop any reserved space the body didn't fill
+                    dst.truncate()
+            
+            self.logger.info("File streamed locally: %s", storage_path)
+            return storage_path, size
+            
+        except Exception as e:
+            if file_path and os.path.exists(file_path):
+                os.remove(file_path)
+            # e.g. RequestEntityTooLarge for a chunked body over MAX_CONTENT_LENGTH;
+            # the client's error, for the route to answer
+            if isinstance(e, HTTPException):
+                raise
+            self.logger.error("Error streaming file locally: %s", e)
+            return None
+    
+    def _upload_stream_supabase(self, stream: IO[bytes], storage_path: str,
+                                content_type: str) -> Optional[Tuple[str, int]]:
+        """Stream a request body to Supabase Storage as a chunked upload"""
+        size = 0
+        
+        def chunks():
+            nonlocal size
+            for chunk in iter(lambda: stream.read(UPLOAD_BUFFER_SIZE), b''):
+                size += len(chunk)
+                yield chunk
+        
+        try:
+            response = self.client.storage.session.post(
+                f"/object/{self.bucket_name}/{storage_path}",
+                content=chunks(),
+                headers={
+                    "content-type": content_type,
+                    "cache-control": "max-age=3600",
+                    "x-upsert": "false"  # Don't overwrite existing files
+                }
+            )
+            
+            if not response.is_success:
+                self.logger.error("Supabase upload failed (%s): %s", response.status_code, response.text)
+                return None
+            
+            self.logger.info("File successfully streamed to Supabase: %s", storage_path)
+            return storage_path, size
+            
+        except HTTPException:
+            # Raised by the request stream (e.g. RequestEntityTooLarge); the
+            # aborted upload leaves no object behind
+            raise
+        except Exception as e:
+            self.logger.error("Error streaming file to Supabase: %s", e)
+            return None
+    
     def _upload_local(self, file: FileStorage, storage_path: str) -> Optional[str]:
         """Upload file to local storage"""
         try:
-            # Create full file path
-            file_path = os.path.join(self.upload_folder, storage_path)
-            
-            # Create directory if it doesn't exist
-            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            # Create full file path (and the user directory on first use)
+            file_path = self._local_upload_path(storage_path)
             
-            # Save file
-            file.save(file_path)
+            # Save file (kernel-side copy when the upload spilled to disk)
+            save_upload(file, file_path)
             
-            self.logger.info(f"File uploaded locally: {storage_path}")
+            self.logger.info("File uploaded locally: %s", storage_path)
             return storage_path
             
         except Exception as e:
-            self.logger.error(f"Error uploading file locally: {str(e)}")
+            self.logger.error("Error uploading file locally: %s", e)
             return None
     
     def _upload_supabase(self, file: FileStorage, storage_path: str) -> Optional[str]:
         """Upload file to Supabase Storage"""
         try:
-            self.logger.info(f"Starting Supabase upload for path: {storage_path}")
-            self.logger.debug(f"File details - Name: {file.filename}, Content-Type: {file.content_type}")
-            
-            # Read file content
-            file_content = file.read()
-            file.seek(0)  # Reset file pointer
-            
-            self.logger.debug(f"File size: {len(file_content)} bytes")
-            
-            # Debug and fix storage client headers
-            if hasattr(self.client.storage, '_client') and hasattr(self.client.storage._client, '_headers'):
-                storage_client = self.client.storage._client
-                self.logger.debug("Storage client headers before upload:")
-                headers = storage_client._headers.copy()
-                for key, value in headers.items():
-                    self.logger.debug(f"  {key}: {repr(value)} (type: {type(value).__name__})")
-                    # Fix any non-string headers
-                    if isinstance(value, bool):
-                        self.logger.info(f"FOUND BOOLEAN HEADER before upload - {key}: {value}, converting to string")
-                        storage_client._headers[key] = str(value).lower()
-                    elif value is None:
-                        self.logger.info(f"Converting None header before upload - {key} to empty string")
-                        storage_client._headers[key] = ""
-                    elif not isinstance(value, str):
-                        self.logger.info(f"Converting non-string header before upload - {key}: {value} to string")
-                        storage_client._headers[key] = str(value)
+            self.logger.info("Starting Supabase upload for path: %s", storage_path)
+            self.logger.debug("File details - Name: %s, Content-Type: %s", file.filename, file.content_type)
             
             # Upload to Supabase Storage
-            self.logger.debug(f"Uploading to bucket: {self.bucket_name}")
+            self.logger.debug("Uploading to bucket: %s", self.bucket_name)
             
-            # Wrap the upload call to catch the exact point of failure
-            try:
-                response = self.client.storage.from_(self.bucket_name).upload(
-                    path=storage_path,
-                    file=file_content,
-                    file_options={
-                        "content-type": file.content_type or 'application/octet-stream',
-                        "upsert": False  # Don't overwrite existing files
-                    }
-                )
-            except AttributeError as ae:
-                self.logger.error(f"AttributeError during upload: {str(ae)}")
-                # Try to find what's causing the boolean issue
-                if hasattr(self.client, '_headers'):
-                    self.logger.error("Client headers at error time:")
-                    for k, v in self.client._headers.items():
-                        self.logger.error(f"  {k}: {repr(v)} (type: {type(v).__name__})")
-                raise
+            # POST the upload's temp file straight from disk/memory: httpx reads
+            # it in chunks while encoding the multipart body, so the whole file
+            # is never held in memory. storage3's upload() only accepts bytes
+            # or real file objects, hence the request is built here.
+            file.stream.seek(0)
+            response = self.client.storage.session.post(
+                f"/object/{self.bucket_name}/{storage_path}",
+                files={
+                    "file": (
+                        os.path.basename(storage_path),
+                        file.stream,
+                        file.content_type or 'application/octet-stream'
+                    )
+                },
+                headers={
+                    "cache-control": "max-age=3600",
+                    "x-upsert": "false"  # Don't overwrite existing files
+                }
+            )
             
-            # Log the response details
-            self.logger.info(f"Supabase upload response: {response}")
-            self.logger.debug(f"Response type: {type(response)}")
+            self.logger.debug("Supabase upload response: %s", response.status_code)
             
             # Check if response indicates success
-            if response is False:
-                self.logger.error("Supabase returned False - upload failed")
+            if not response.is_success:
+                self.logger.error("Supabase upload failed (%s): %s", response.status_code, response.text)
                 self.logger.error("This usually means the file already exists or there's a permission issue")
                 return None
             
-            self.logger.info(f"File successfully uploaded to Supabase: {storage_path}")
+            self.logger.info("File successfully uploaded to Supabase: %s", storage_path)
             return storage_path
             
         except Exception as e:
-            self.logger.error(f"Error uploading file to Supabase: {str(e)}")
-            self.logger.exception("Full traceback:")
+            self.logger.exception("Error uploading file to Supabase: %s", e)
             return None
     
-    def get_download_info(self, storage_path: str) -> Tuple[Optional[str], Optional[bytes]]:
+    def get_download_info(self, storage_path: str) -> Tuple[Optional[str], Optional[str]]:
         """
         Get download information based on storage mode.
         
-        For local storage: Returns (None, file_bytes)
+        For local storage: Returns (None, local_path)
         For Supabase: Returns (signed_url, None)
         
         Args:
             storage_path: The storage path of the file
             
         Returns:
-            Tuple of (url, bytes) - only one will be non-None based on storage mode
+            Tuple of (url, local_path) - only one will be non-None based on storage mode
         """
         if self.storage_mode == 'local':
-            file_bytes = self._download_local(storage_path)
-            return (None, file_bytes)
+            local_path = self._local_path(storage_path)
+            return (None, local_path)
         else:
             # Generate a signed URL valid for 1 hour
-            signed_url = self._get_supabase_signed_url(storage_path, expires_in=3600)
+            signed_url = self._get_supabase_signed_url(storage_path, expires_in=SIGNED_URL_EXPIRES_IN)
             return (signed_url, None)
     
+    def get_signed_urls(self, storage_paths: List[str]) -> Dict[str, str]:
+        """
+        Get signed download URLs for several Supabase files; those not cached
+        are signed together in one request
+        
+        Args:
+            storage_paths: The storage paths of the files
+            
+        Returns:
+            Dict of storage path to signed URL (empty in local storage mode);
+            paths that couldn't be signed are left out
+        """
+        if self.storage_mode == 'local':
+            return {}
+        return self._get_supabase_signed_urls(storage_paths, expires_in=SIGNED_URL_EXPIRES_IN)
+    
     def _get_supabase_signed_url(self, storage_path: str, expires_in: int) -> Optional[str]:
-        """Get a temporary signed URL from Supabase"""
+        """Get a temporary signed URL from Supabase (see `_get_supabase_signed_urls`)"""
+        return self._get_supabase_signed_urls([storage_path], expires_in).get(storage_path)
+    
+    def _get_supabase_signed_urls(self, storage_paths: List[str], expires_in: int) -> Dict[str, str]:
+        """
+        Get temporary signed URLs from Supabase, reusing ones issued earlier
+        while they have more than SIGNED_URL_REUSE_MARGIN seconds left
+        """
+        now = time.monotonic()
+        signed_urls = {}
+        with self._signed_urls_lock:
+            for storage_path in storage_paths:
+                cached = self._signed_urls.get(storage_path)
+                if cached and cached[1] > now:
+                    self._signed_urls.move_to_end(storage_path)
+                    signed_urls[storage_path] = cached[0]
+        
+        missing = [storage_path for storage_path in dict.fromkeys(storage_paths) if storage_path not in signed_urls]
+        if not missing:
+            return signed_urls
+        
+        # Signed in one request. storage3's create_signed_urls() can't be used:
+        # it fails the whole batch when any one path has no signedURL
         try:
-            response = self.client.storage.from_(self.bucket_name).create_signed_url(
-                path=storage_path,
-                expires_in=expires_in
+            session = self.client.storage.session
+            response = session.post(
+                f"/object/sign/{self.bucket_name}",
+                json={"expiresIn": expires_in, "paths": missing}
             )
-            return response['signedURL']
+            if not response.is_success:
+                logger.error("Error creating signed URLs (%s): %s", response.status_code, response.text)
+                return signed_urls
+            
+            issued = {}
+            for item in response.json():
+                if item.get('error') or not item.get('signedURL'):
+                    logger.warning("Could not sign %s: %s", item.get('path'), item.get('error'))
+                    continue
+                issued[item['path']] = f"{session.base_url}{item['signedURL'].lstrip('/')}"
         except Exception as e:
-            logger.error(f"Error creating signed URL: {str(e)}")
-            return None
+            logger.error("Error creating signed URL: %s", e)
+            return signed_urls
+        
+        with self._signed_urls_lock:
+            for storage_path, signed_url in issued.items():
+                self._signed_urls[storage_path] = (signed_url, now + expires_in - SIGNED_URL_REUSE_MARGIN)
+                self._signed_urls.move_to_end(storage_path)
+            while len(self._signed_urls) > SIGNED_URL_CACHE_SIZE:
+                self._signed_urls.popitem(last=False)
+        
+        signed_urls.update(issued)
+        return signed_urls
     
-    def _download_local(self, storage_path: str) -> Optional[bytes]:
-        """Download file from local storage"""
-        try:
-            file_path = os.path.join(self.upload_folder, storage_path)
-            with open(file_path, 'rb') as f:
-                return f.read()
-        except Exception as e:
-            logger.error(f"Error downloading file locally: {str(e)}")
-            return None
+    def _local_path(self, storage_path: str) -> Optional[str]:
+        """
+        Path of a file in local storage, so it can be streamed from disk
+        instead of read into memory
+        """
+        # safe_join (as used by send_from_directory) refuses paths outside the
+        # folder; existence is left to the caller opening the file
+        file_path = safe_join(self.upload_folder, storage_path)
+        if file_path is None:
+            logger.error("Refusing storage path outside the upload folder: %s", storage_path)
+        return file_path
     
     def delete_file(self, storage_path: str) -> bool:
         """
@@ -282,32 +441,52 @@ class StorageService:
         Returns:
             True if successful, False otherwise
         """
+        return self.delete_files([storage_path])
+    
+    def delete_files(self, storage_paths: List[str]) -> bool:
+        """
+        Delete several files from storage; Supabase removes them all in one request
+        
+        Args:
+            storage_paths: The storage paths of the files
+            
+        Returns:
+            True if every file was deleted, False otherwise
+        """
+        if not storage_paths:
+            return True
+        
         if self.storage_mode == 'local':
-            return self._delete_local(storage_path)
+            return all([self._delete_local(storage_path) for storage_path in storage_paths])
         else:
-            return self._delete_supabase(storage_path)
+            with self._signed_urls_lock:
+                for storage_path in storage_paths:
+                    self._signed_urls.pop(storage_path, None)
+            return self._delete_supabase(storage_paths)
     
     def _delete_local(self, storage_path: str) -> bool:
         """Delete file from local storage"""
         try:
-            file_path = os.path.join(self.upload_folder, storage_path)
-            if os.path.exists(file_path):
-                os.remove(file_path)
-                logger.info(f"File deleted locally: {storage_path}")
-                return True
+            file_path = safe_join(self.upload_folder, storage_path)
+            if file_path is None:
+                return False
+            os.remove(file_path)
+            logger.info("File deleted locally: %s", storage_path)
+            return True
+        except FileNotFoundError:
             return False
         except Exception as e:
-            logger.error(f"Error deleting file locally: {str(e)}")
+            logger.error("Error deleting file locally: %s", e)
             return False
     
-    def _delete_supabase(self, storage_path: str) -> bool:
-        """Delete file from Supabase Storage"""
+    def _delete_supabase(self, storage_paths: List[str]) -> bool:
+        """Delete files from Supabase Storage in a single request"""
         try:
-            response = self.client.storage.from_(self.bucket_name).remove([storage_path])
-            logger.info(f"File deleted from Supabase: {storage_path}")
+            self.client.storage.from_(self.bucket_name).remove(storage_paths)
+            logger.info("Files deleted from Supabase: %s", storage_paths)
             return True
         except Exception as e:
-            logger.error(f"Error deleting file from Supabase: {str(e)}")
+            logger.error("Error deleting file from Supabase: %s", e)
             return False
     
     def is_using_supabase(self) -> bool:
@@ -321,17 +500,28 @@ class StorageService:
         
         try:
             self._ensure_bucket_exists()
-            return True
+            return self._bucket_verified
         except Exception as e:
-            logger.error(f"Failed to ensure bucket exists: {str(e)}")
+            logger.error("Failed to ensure bucket exists: %s", e)
             return False
 
-# Create a singleton instance
-storage_service = None
+# Guards creating the per-app storage service
+_storage_service_lock = threading.Lock()
 
 def get_storage_service():
-    """Get or create the storage service instance"""
-    global storage_service
-    if storage_service is None:
-        storage_service = StorageService()
-    return storage_service
\ No newline at end of file
+    """
+    Get or create the current app's storage service
+    
+    One instance per app, kept as `app.extensions['storage']`, so the Supabase
+    client and its HTTP connection pool are reused across requests while each
+    app (e.g. in tests) gets a service built from its own config. The lock
+    keeps concurrent first requests on threaded workers from each building
+    their own client.
+    """
+    service = current_app.extensions.get('storage')
+    if service is None:
+        with _storage_service_lock:
+            service = current_app.extensions.get('storage')
+            if service is None:
+                service = current_app.extensions['storage'] = StorageService()
+    return service
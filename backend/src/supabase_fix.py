@@ -2,13 +2,57 @@
 Fix for Supabase client header encoding issues
 """
 import logging
-from typing import Any, Dict, Optional
+
+# HTTP/2 needs the optional h2 package; fall back to HTTP/1.1 without it
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
 
 logger = logging.getLogger(__name__)
 
+# Connection pool shared by every Supabase Storage request in this process
+STORAGE_POOL_LIMITS = dict(max_connections=60, max_keepalive_connections=40, keepalive_expiry=60)
+STORAGE_TIMEOUT = dict(timeout=30.0, connect=5.0)
+STORAGE_CONNECT_RETRIES = 3
+
+# Request headers storage3 may fill with bools, which httpx rejects
+UPLOAD_FLAG_HEADERS = ('x-upsert', 'upsert')
+
+
+def _use_pooled_storage_session(client) -> None:
+    """
+    Swap the storage client's httpx session for one with an explicitly sized
+    keep-alive pool, so concurrent uploads don't queue for connections or
+    redo TCP/TLS setup. With h2 installed the session speaks HTTP/2, so
+    concurrent requests share multiplexed connections.
+    """
+    import httpx
+    from storage3.utils import SyncClient
+    
+    storage = client.storage
+    old_session = storage.session
+    session = SyncClient(
+        base_url=old_session.base_url,
+        headers=old_session.headers,
+        timeout=httpx.Timeout(**STORAGE_TIMEOUT),
+        transport=httpx.HTTPTransport(
+            retries=STORAGE_CONNECT_RETRIES,
+            limits=httpx.Limits(**STORAGE_POOL_LIMITS),
+            http2=HTTP2_AVAILABLE
+        )
+    )
+    old_session.close()
+    
+    # SyncStorageClient keeps the session under both names
+    storage.session = session
+    storage._client = session
+
 def create_fixed_supabase_client(url: str, key: str):
     """
-    Create a Supabase client with fixed headers to prevent boolean encoding errors
+    Create a Supabase client whose storage requests never send boolean
+    header values (httpx can't encode them)
     """
     from supabase import create_client, Client
     
@@ -16,68 +60,28 @@ def create_fixed_supabase_client(url: str, key: str):
     url = str(url) if url else ""
     key = str(key) if key else ""
     
-    logger.debug(f"Creating Supabase client with URL: {url[:50]}...")
+    logger.debug("Creating Supabase client with URL: %s...", url[:50])
     
     # Create the client
     client = create_client(url, key)
+    _use_pooled_storage_session(client)
     
-    # Fix headers in the client and its sub-clients
-    def fix_headers(obj: Any, path: str = ""):
-        """Recursively fix headers in an object"""
-        if hasattr(obj, '_headers'):
-            logger.debug(f"Checking headers at {path}")
-            headers = obj._headers
-            if isinstance(headers, dict):
-                for k, v in list(headers.items()):
-                    if isinstance(v, bool):
-                        logger.info(f"FOUND BOOLEAN HEADER at {path}.{k}: {v} -> converting to {str(v).lower()}")
-                        logger.info(f"Boolean header details - key: '{k}', value: {v}, type: {type(v)}")
-                        headers[k] = str(v).lower()
-                    elif v is None:
-                        logger.info(f"Fixed None header at {path}.{k} -> empty string")
-                        headers[k] = ""
-                    elif not isinstance(v, str):
-                        logger.info(f"Fixed non-string header at {path}.{k}: {v} ({type(v)}) -> {str(v)}")
-                        headers[k] = str(v)
-        
-        # Check nested clients
-        if hasattr(obj, 'storage'):
-            fix_headers(obj.storage, f"{path}.storage")
-        if hasattr(obj, '_client'):
-            fix_headers(obj._client, f"{path}._client")
-        if hasattr(obj, 'auth'):
-            fix_headers(obj.auth, f"{path}.auth")
-    
-    # Apply fixes
-    fix_headers(client, "client")
+    # Only the upload flags ever arrive as Python bools (storage3 copies
+    # file_options such as upsert=False straight into the request headers),
+    # so fix those keys instead of scanning every header on every request
+    storage_client = client.storage._client
+    original_request = storage_client.request
     
-    # Monkey patch the storage client's request method to ensure headers are always strings
-    if hasattr(client, 'storage') and hasattr(client.storage, '_client'):
-        storage_client = client.storage._client
-        original_request = storage_client.request
-        
-        def safe_request(method, url, **kwargs):
-            # Ensure all headers are strings
-            if 'headers' in kwargs and isinstance(kwargs['headers'], dict):
-                safe_headers = {}
-                for k, v in kwargs['headers'].items():
-                    if isinstance(v, bool):
-                        #TODO: this is for vercel env got error: FOUND BOOLEAN HEADER in request - key: 'upsert', value: False
-                        logger.info(f"FOUND BOOLEAN HEADER in request - key: '{k}', value: {v}")
-                        safe_headers[k] = str(v).lower()
-                    elif v is None:
-                        logger.info(f"Found None header in request - key: '{k}'")
-                        safe_headers[k] = ""
-                    elif not isinstance(v, str):
-                        logger.info(f"Found non-string header in request - key: '{k}', value: {v}, type: {type(v)}")
-                        safe_headers[k] = str(v)
-                    else:
-                        safe_headers[k] = v
-                kwargs['headers'] = safe_headers
-            
-            return original_request(method, url, **kwargs)
+    def safe_request(method, url, **kwargs):
+        headers = kwargs.get('headers')
+        if isinstance(headers, dict):
+            for key in UPLOAD_FLAG_HEADERS:
+                if isinstance(headers.get(key), bool):
+                    headers[key] = str(headers[key]).lower()
         
-        storage_client.request = safe_request
-        logger.debug("Patched storage client request method")
+        return original_request(method, url, **kwargs)
+    
+    storage_client.request = safe_request
+    logger.debug("Patched storage client request method")
     
     return client
\ No newline at end of file
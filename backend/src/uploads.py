@@ -0,0 +1,172 @@
+"""
+Request class tuned for large multipart file uploads
+"""
+import hashlib
+import os
+import shutil
+from tempfile import SpooledTemporaryFile
+from typing import IO, Optional
+
+from flask import Request
+from werkzeug.datastructures import FileStorage
+from werkzeug.formparser import FormDataParser, MultiPartParser
+
+# Read the request body in 1 MB chunks instead of werkzeug's 64 KB, so a large
+# upload goes through the multipart parser loop 16x fewer times
+UPLOAD_BUFFER_SIZE = 1024 * 1024
+
+# Uploaded files up to this size stay in memory; larger ones spill to disk
+UPLOAD_SPOOL_SIZE = 1024 * 1024
+
+# Local files at least this large get their disk space reserved up front
+PREALLOCATE_MIN_SIZE = 16 * 1024 * 1024
+
+
+class CountingSpooledFile(SpooledTemporaryFile):
+    """
+    Spooled temp file that counts and SHA-256 hashes the bytes the parser
+    writes into it, so neither needs another pass over the upload.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.bytes_written = 0
+        self.sha256 = hashlib.sha256()
+
+    def write(self, s):
+        self.bytes_written += len(s)
+        self.sha256.update(s)
+        return super().write(s)
+
+
+class HashingReader:
+    """Wraps a stream, SHA-256 hashing the bytes as they are read from it."""
+
+    def __init__(self, stream: IO[bytes]):
+        self.stream = stream
+        self.sha256 = hashlib.sha256()
+
+    def read(self, size: int = -1) -> bytes:
+        chunk = self.stream.read(size)
+        self.sha256.update(chunk)
+        return chunk
+
+
+def uploaded_size(file: FileStorage) -> int:
+    """Size of an uploaded file in bytes, without re-reading it when possible."""
+    size = getattr(file.stream, 'bytes_written', None)
+    if size is not None:
+        return size
+
+    # Not parsed by UploadRequest: measure by seeking
+    position = file.stream.tell()
+    file.stream.seek(0, 2)
+    size = file.stream.tell()
+    file.stream.seek(position)
+    return size
+
+
+def uploaded_digest(file: FileStorage) -> str:
+    """Hex SHA-256 of an uploaded file, without re-reading it when possible."""
+    sha256 = getattr(file.stream, 'sha256', None)
+    if sha256 is not None:
+        return sha256.hexdigest()
+
+    # Not parsed by UploadRequest: hash the stream
+    position = file.stream.tell()
+    file.stream.seek(0)
+    sha256 = hashlib.sha256()
+    for chunk in iter(lambda: file.stream.read(UPLOAD_BUFFER_SIZE), b''):
+        sha256.update(chunk)
+    file.stream.seek(position)
+    return sha256.hexdigest()
+
+
+def preallocate(fd: int, size: Optional[int]) -> bool:
+    """
+    Reserve `size` bytes for a new file before writing it, so ext4/XFS can
+    allocate contiguous extents instead of growing the file write by write.
+    
+    This extends the file to `size`; when fewer bytes end up written the
+    caller must truncate. Returns whether space was reserved.
+    """
+    if not size or size < PREALLOCATE_MIN_SIZE or not hasattr(os, 'posix_fallocate'):
+        return False
+    try:
+        os.posix_fallocate(fd, 0, size)
+        return True
+    except OSError:
+        # e.g. not supported by the filesystem, or not enough space (which
+        # the write itself will then report)
+        return False
+
+
+def save_upload(file: FileStorage, path: str) -> None:
+    """
+    Write an uploaded file to `path`.
+    
+    Uploads that spilled to a temp file on disk are copied by the kernel with
+    os.sendfile; in-memory ones (and platforms where sendfile can't write to a
+    regular file) are copied in UPLOAD_BUFFER_SIZE chunks rather than
+    werkzeug's 16 KB.
+    """
+    src = file.stream
+    src.seek(0)
+    
+    with open(path, 'wb') as dst:
+        # fileno() on a SpooledTemporaryFile would force it onto disk first
+        on_disk = src._rolled if isinstance(src, SpooledTemporaryFile) else hasattr(src, 'fileno')
+        if on_disk:
+            try:
+                src_fd = src.fileno()
+                size = os.fstat(src_fd).st_size
+                preallocate(dst.fileno(), size)
+                offset = 0
+                while offset < size:
+                    sent = os.sendfile(dst.fileno(), src_fd, offset, size - offset)
+                    if sent == 0:
+                        break
+                    offset += sent
+                return
+            except (AttributeError, OSError):
+                # Not a real file, or sendfile unsupported: copy in Python
+                src.seek(0)
+                dst.seek(0)
+                dst.truncate()
+        
+        shutil.copyfileobj(src, dst, UPLOAD_BUFFER_SIZE)
+
+
+class UploadFormDataParser(FormDataParser):
+    """Form data parser that feeds the multipart decoder larger chunks."""
+
+    def _parse_multipart(self, stream, mimetype, content_length, options):
+        parser = MultiPartParser(
+            stream_factory=self.stream_factory,
+            max_form_memory_size=self.max_form_memory_size,
+            max_form_parts=self.max_form_parts,
+            cls=self.cls,
+            buffer_size=UPLOAD_BUFFER_SIZE,
+        )
+        boundary = options.get('boundary', '').encode('ascii')
+
+        if not boundary:
+            raise ValueError('Missing boundary')
+
+        form, files = parser.parse(stream, boundary, content_length)
+        return stream, form, files
+
+
+class UploadRequest(Request):
+    """Flask request that streams uploaded files into spooled temp files."""
+
+    form_data_parser_class = UploadFormDataParser
+
+    def _get_file_stream(
+        self,
+        total_content_length: Optional[int],
+        content_type: Optional[str],
+        filename: Optional[str] = None,
+        content_length: Optional[int] = None,
+    ) -> IO[bytes]:
+        return CountingSpooledFile(max_size=UPLOAD_SPOOL_SIZE, mode='rb+')
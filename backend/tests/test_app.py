@@ -1,14 +1,24 @@
 """
 Tests for the Flask application
 """
+import io
+import os
 import pytest
 import sys
+from datetime import datetime
 from pathlib import Path
 
+from sqlalchemy import event, insert
+
 # Add parent directory to path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
+# Run against TestingConfig (in-memory SQLite) unless told otherwise
+os.environ.setdefault('FLASK_ENV', 'testing')
+
 from src.app import app
+from src.models import db, File
+from src.storage import StorageService
 
 
 @pytest.fixture
@@ -19,6 +29,45 @@ def client():
         yield client
 
 
+@pytest.fixture
+def database():
+    """
+    Create the tables for a test and drop them afterwards. No app context is
+    left pushed: requests would share it, and with it `g` (the current user).
+    """
+    with app.app_context():
+        db.create_all()
+    yield db
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def storage(monkeypatch, tmp_path):
+    """Local storage in a temporary folder, used by the app for this test"""
+    with app.app_context():
+        service = StorageService({'STORAGE_MODE': 'local', 'UPLOAD_FOLDER': str(tmp_path)})
+    monkeypatch.setitem(app.extensions, 'storage', service)
+    return service
+
+
+def auth_headers(client, username):
+    """Sign up a user and return the Authorization header for them"""
+    response = client.post('/api/auth/signup', json={
+        'email': f'{username}@example.com',
+        'username': username,
+        'password': 'secret123',
+    })
+    assert response.status_code == 201
+    return {'Authorization': f"Bearer {response.get_json()['token']}"}
+
+
+def stored_files(storage):
+    """Paths of the files in a local storage folder"""
+    return [path for path in Path(storage.upload_folder).rglob('*') if path.is_file()]
+
+
 def test_index_route(client):
     """Test the index route"""
     response = client.get('/')
@@ -38,4 +87,231 @@ def test_health_route(client):
     assert 'status' in data
     assert data['status'] == 'healthy'
     assert 'service' in data
-    assert data['service'] == 'backend-api'
\ No newline at end of file
+    assert data['service'] == 'backend-api'
+
+def test_protected_route_rejects_malformed_token(client):
+    """Test that malformed Authorization headers are rejected"""
+    for header in ['Bearer', 'Bearer not-a-jwt', 'Basic dXNlcjpwYXNz']:
+        response = client.get('/api/auth/me', headers={'Authorization': header})
+        assert response.status_code == 401
+        assert response.get_json()['error'] == 'Authentication required'
+
+
+def test_chunked_stream_upload_over_limit(client, monkeypatch, storage):
+    """Test that an oversized chunked PUT gets a 413 and leaves no file behind"""
+    from types import SimpleNamespace
+
+    monkeypatch.setattr('src.auth._load_current_user', lambda: SimpleNamespace(id=1))
+    monkeypatch.setitem(app.config, 'MAX_CONTENT_LENGTH', 1024)
+
+    # Chunked bodies have no Content-Length; the server terminates the stream
+    response = client.put(
+        '/api/files/big.bin',
+        input_stream=io.BytesIO(b'x' * 4096),
+        headers={'Transfer-Encoding': 'chunked'},
+        environ_overrides={'wsgi.input_terminated': True},
+    )
+    assert response.status_code == 413
+    assert response.get_json()['error'] == 'File too large'
+    assert stored_files(storage) == []
+
+
+def test_signed_urls_skip_paths_that_fail():
+    """Test that one unsignable path doesn't drop the rest of a signing batch"""
+    import json
+    import threading
+    from collections import OrderedDict
+    from types import SimpleNamespace
+    httpx = pytest.importorskip('httpx')
+
+    def sign(request):
+        assert request.url.path == '/storage/v1/object/sign/files'
+        return httpx.Response(200, json=[
+            {'path': path, 'error': 'Object not found', 'signedURL': None} if path == 'missing'
+            else {'path': path, 'error': None, 'signedURL': f'/object/sign/files/{path}?token=t'}
+            for path in json.loads(request.content)['paths']
+        ])
+
+    session = httpx.Client(base_url='http://supabase.test/storage/v1/', transport=httpx.MockTransport(sign))
+    storage = StorageService.__new__(StorageService)
+    storage.storage_mode = 'supabase'
+    storage.bucket_name = 'files'
+    storage.client = SimpleNamespace(storage=SimpleNamespace(session=session))
+    storage._signed_urls = OrderedDict()
+    storage._signed_urls_lock = threading.Lock()
+
+    assert storage.get_signed_urls(['a', 'missing', 'b']) == {
+        'a': 'http://supabase.test/storage/v1/object/sign/files/a?token=t',
+        'b': 'http://supabase.test/storage/v1/object/sign/files/b?token=t',
+    }
+
+
+def test_list_files_cursor_and_page_paging(client, database):
+    """Test keyset and numbered paging over files uploaded in the same instant"""
+    headers = auth_headers(client, 'pager')
+    uploaded_at = datetime(2026, 1, 1)
+    with app.app_context():
+        database.session.execute(insert(File), [{
+            'filename': f'f{i}', 'original_filename': f'f{i}.txt', 'file_path': f'user_1/f{i}',
+            'file_size': i, 'user_id': 1, 'uploaded_at': uploaded_at,
+        } for i in range(1, 6)])
+        database.session.commit()
+        engine = database.engine
+
+    # Cursor pages: newest first, ties broken by id
+    pages, cursor = [], ''
+    while True:
+        pagination = client.get(f'/api/files?size=2{cursor}', headers=headers).get_json()
+        pages.append([file['id'] for file in pagination['files']])
+        pagination = pagination['pagination']
+        if not pagination['has_next']:
+            assert pagination['next_cursor'] is None
+            break
+        cursor = f"&cursor={pagination['next_cursor']}"
+    assert pages == [[5, 4], [3, 2], [1]]
+
+    # Numbered pages: only a page with more rows after it needs the COUNT(*)
+    statements = []
+    record = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        first = client.get('/api/files?size=2', headers=headers).get_json()['pagination']
+        counted = sum('count(' in statement.lower() for statement in statements)
+        last = client.get('/api/files?size=2&page=3', headers=headers).get_json()['pagination']
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    assert (first['total'], first['has_next'], first['next_cursor']) == (5, True, 4)
+    assert (last['total'], last['pages'], last['has_next']) == (5, 3, False)
+    assert counted == 1
+    assert sum('count(' in statement.lower() for statement in statements) == 1
+
+
+@pytest.fixture
+def login_attempts(monkeypatch):
+    """Start each test with no recorded login attempts"""
+    monkeypatch.setattr('src.auth._login_attempts', {})
+
+
+def failed_login(client, remote_addr='10.0.0.1'):
+    """Post a login with a wrong password and return the status code"""
+    response = client.post('/api/auth/login', json={
+        'email': 'nobody@example.com',
+        'password': 'wrong',
+    }, environ_base={'REMOTE_ADDR': remote_addr})
+    return response.status_code
+
+
+def test_login_rate_limit(client, database, login_attempts, monkeypatch):
+    """Test that an address is limited per minute without affecting others"""
+    monkeypatch.setitem(app.config, 'LOGIN_ATTEMPTS_PER_MINUTE', 10)
+    
+    assert [failed_login(client) for _ in range(10)] == [401] * 10
+    assert failed_login(client) == 429
+    assert failed_login(client, remote_addr='10.0.0.2') == 401
+
+
+def test_login_rate_limit_disabled(client, database, login_attempts, monkeypatch):
+    """Test that LOGIN_ATTEMPTS_PER_MINUTE=0 turns the limit off"""
+    monkeypatch.setitem(app.config, 'LOGIN_ATTEMPTS_PER_MINUTE', 0)
+    
+    assert [failed_login(client) for _ in range(15)] == [401] * 15
+
+
+@pytest.mark.parametrize('provider', ['IsoJSONProvider', 'OrjsonProvider'])
+def test_json_datetimes_are_utc_iso(provider):
+    """Test that both JSON providers encode datetimes as ISO 8601 with a Z suffix"""
+    from datetime import timezone
+    from src import json_provider
+    
+    if provider == 'OrjsonProvider' and not json_provider.ORJSON_AVAILABLE:
+        pytest.skip('orjson is not installed')
+    
+    json = getattr(json_provider, provider)(app)
+    encoded = json.loads(json.dumps({
+        'naive': datetime(2026, 1, 2, 3, 4, 5),
+        'utc': datetime(2026, 1, 2, 3, 4, 5, tzinfo=timezone.utc),
+    }))
+    assert encoded == {'naive': '2026-01-02T03:04:05Z', 'utc': '2026-01-02T03:04:05Z'}
+
+
+def batch_upload(client, headers, *files):
+    """POST (name, content) pairs to the batch upload endpoint"""
+    return client.post('/api/files/batch', headers=headers, data={
+        'file': [(io.BytesIO(content), name) for name, content in files],
+    }, content_type='multipart/form-data')
+
+
+def test_batch_upload(client, database, storage):
+    """Test that a batch returns its files in request order and stores repeated content once"""
+    headers = auth_headers(client, 'batcher')
+    
+    response = batch_upload(client, headers, ('a.txt', b'first'), ('b.txt', b'second'), ('c.txt', b'first'))
+    assert response.status_code == 201
+    files = response.get_json()['files']
+    assert [file['filename'] for file in files] == ['a.txt', 'b.txt', 'c.txt']
+    
+    with app.app_context():
+        rows = database.session.scalars(database.select(File).order_by(File.id)).all()
+    assert [row.id for row in rows] == [file['id'] for file in files]
+    assert rows[0].file_path == rows[2].file_path != rows[1].file_path
+    assert len(stored_files(storage)) == 2
+
+
+def test_batch_upload_storage_failure(client, database, storage, monkeypatch):
+    """Test that a failed storage upload keeps neither records nor stored files"""
+    headers = auth_headers(client, 'batcher')
+    upload_file = storage.upload_file
+    monkeypatch.setattr(storage, 'upload_file', lambda file, user_id, filename: (
+        None if file.filename == 'b.txt' else upload_file(file, user_id, filename)
+    ))
+    
+    response = batch_upload(client, headers, ('a.txt', b'first'), ('b.txt', b'second'), ('c.txt', b'third'))
+    assert response.status_code == 500
+    with app.app_context():
+        assert database.session.scalar(database.select(database.func.count(File.id))) == 0
+    assert stored_files(storage) == []
+
+
+def test_batch_upload_too_many_files(client, database, storage):
+    """Test that a batch over MAX_BATCH_FILES is rejected before anything is stored"""
+    from src.routes.files import MAX_BATCH_FILES
+    headers = auth_headers(client, 'batcher')
+    
+    response = batch_upload(client, headers, *[(f'{i}.txt', b'x') for i in range(MAX_BATCH_FILES + 1)])
+    assert response.status_code == 400
+    assert stored_files(storage) == []
+
+
+def test_stream_uploads_share_stored_content(client, database, storage):
+    """Test that PUTs of the same bytes keep one stored copy that outlives either record"""
+    alice, bob = auth_headers(client, 'alice'), auth_headers(client, 'bob')
+    
+    ids = [
+        client.put('/api/files/report.txt', headers=headers, data=b'same bytes').get_json()['file']['id']
+        for headers in (alice, bob)
+    ]
+    assert len(stored_files(storage)) == 1
+    
+    assert client.delete(f'/api/files/{ids[0]}', headers=alice).status_code == 200
+    response = client.get(f'/api/files/{ids[1]}/download', headers=bob)
+    assert response.status_code == 200
+    assert response.data == b'same bytes'
+    response.close()
+
+
+def test_download_urls(client, database, storage):
+    """Test that download URLs are only given for the user's live files"""
+    alice, bob = auth_headers(client, 'alice'), auth_headers(client, 'bob')
+    kept, deleted = (
+        client.put(f'/api/files/{name}', headers=alice, data=name.encode()).get_json()['file']['id']
+        for name in ('kept.txt', 'deleted.txt')
+    )
+    other = client.put('/api/files/other.txt', headers=bob, data=b'other').get_json()['file']['id']
+    client.delete(f'/api/files/{deleted}', headers=alice)
+    
+    response = client.post('/api/files/download-urls', headers=alice, json={'ids': [kept, deleted, other]})
+    assert response.status_code == 200
+    assert response.get_json() == {'urls': {str(kept): f'/api/files/{kept}/download'}}
+    
+    response = client.post('/api/files/download-urls', headers=alice, json={'ids': 'nope'})
+    assert response.status_code == 400